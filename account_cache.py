@@ -0,0 +1,158 @@
+"""Local cache of the Firefly accounts used by the import.
+
+Only the fields needed to match accounts are stored, per account type, together
+with the number of accounts Firefly reported and when they were fetched. A run
+compares that number with a cheap probe, and only fetches all accounts of a type
+again when they differ or the cache is too old. A type is also fetched again when
+Firefly rejected one of its accounts, which catches renamed or replaced accounts.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from sqlite_store import SQLiteStore
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT,
+    iban TEXT,
+    account_role TEXT,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS accounts_type ON accounts (type, position);
+CREATE TABLE IF NOT EXISTS account_types (
+    type TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def compact_account(account: dict[str, Any]) -> dict[str, Any]:
+    """Strip a Firefly account down to the fields used by the import."""
+    attributes = account["attributes"]
+    return {
+        "id": str(account["id"]),
+        "type": "accounts",
+        "attributes": {
+            "type": attributes.get("type"),
+            "name": attributes.get("name"),
+            "iban": attributes.get("iban"),
+            "account_role": attributes.get("account_role"),
+        },
+    }
+
+
+class AccountCache(SQLiteStore):
+    """SQLite cache of compact Firefly accounts, per account type."""
+
+    schema = SCHEMA
+    schema_version = SCHEMA_VERSION
+    tables = ("accounts", "account_types")
+    outdated_message = "Firefly account cache is outdated, clearing it"
+
+    def load(self, account_type: str) -> tuple[list[dict[str, Any]], int, float] | None:
+        """Get the cached accounts of a type, their total and when they were synced."""
+        row = self.connection.execute(
+            "SELECT total, synced_at FROM account_types WHERE type = ?",
+            (account_type,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        accounts = [
+            {
+                "id": account_id,
+                "type": "accounts",
+                "attributes": {
+                    "type": account_type,
+                    "name": name,
+                    "iban": iban,
+                    "account_role": account_role,
+                },
+            }
+            for account_id, name, iban, account_role in self.connection.execute(
+                "SELECT id, name, iban, account_role FROM accounts "
+                "WHERE type = ? ORDER BY position",
+                (account_type,),
+            )
+        ]
+        return accounts, row[0], row[1]
+
+    def replace(self, account_type: str, accounts: list[dict[str, Any]]) -> None:
+        """Replace the cached accounts of a type after a full fetch."""
+        rows = [
+            (
+                account["id"],
+                account_type,
+                account["attributes"]["name"],
+                account["attributes"]["iban"],
+                account["attributes"]["account_role"],
+                position,
+            )
+            for position, account in enumerate(map(compact_account, accounts))
+        ]
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM accounts WHERE type = ?", (account_type,)
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO accounts "
+                "(id, type, name, iban, account_role, position) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO account_types (type, total, synced_at) "
+                "VALUES (?, ?, ?)",
+                (account_type, len(rows), time.time()),
+            )
+
+    def add(self, account: dict[str, Any]) -> None:
+        """Add an account created during an import, keeping the total in sync."""
+        account = compact_account(account)
+        account_type = account["attributes"]["type"]
+        with self.connection:
+            if (
+                self.connection.execute(
+                    "SELECT 1 FROM account_types WHERE type = ?", (account_type,)
+                ).fetchone()
+                is None
+            ):
+                # Nothing cached for this type yet, the next run fetches it
+                return
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO accounts "
+                "(id, type, name, iban, account_role, position) "
+                "VALUES (?, ?, ?, ?, ?, "
+                "(SELECT COALESCE(MAX(position), -1) + 1 FROM accounts))",
+                (
+                    account["id"],
+                    account_type,
+                    account["attributes"]["name"],
+                    account["attributes"]["iban"],
+                    account["attributes"]["account_role"],
+                ),
+            )
+            self.connection.execute(
+                "UPDATE account_types SET total = "
+                "(SELECT COUNT(*) FROM accounts WHERE type = ?) WHERE type = ?",
+                (account_type, account_type),
+            )
+
+    def invalidate(self, account_type: str) -> None:
+        """Forget the cached accounts of a type, so the next run fetches them."""
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM accounts WHERE type = ?", (account_type,)
+            )
+            self.connection.execute(
+                "DELETE FROM account_types WHERE type = ?", (account_type,)
+            )
@@ -0,0 +1,77 @@
+"""Index of Firefly accounts used to match TrueLayer data during an import."""
+
+from __future__ import annotations
+
+from typing import Any
+
+
+def normalize_iban(iban: str | None) -> str | None:
+    """Normalize an IBAN for comparison, ignoring spaces and case."""
+    if not iban:
+        return None
+    return iban.replace(" ", "").upper()
+
+
+class AccountIndex:
+    """Firefly accounts indexed by (type, IBAN) and (type, name).
+
+    When several accounts share a key, the first one wins, in the order the
+    accounts were returned by Firefly.
+    """
+
+    def __init__(self, accounts: list[dict[str, Any]] | None = None) -> None:
+        """Initialize the index with the given accounts."""
+        self._accounts: list[dict[str, Any]] = []
+        self._by_iban: dict[tuple[str, str], dict[str, Any]] = {}
+        self._by_name: dict[tuple[str, str], dict[str, Any]] = {}
+        self._all_by_iban: dict[str, list[dict[str, Any]]] = {}
+
+        for account in accounts or []:
+            self.add(account)
+
+    def __len__(self) -> int:
+        """Get the number of indexed accounts."""
+        return len(self._accounts)
+
+    @property
+    def accounts(self) -> list[dict[str, Any]]:
+        """Get all indexed accounts."""
+        return self._accounts
+
+    def add(self, account: dict[str, Any]) -> None:
+        """Add an account to the index."""
+        self._accounts.append(account)
+        attributes = account["attributes"]
+        account_type = attributes.get("type")
+
+        if iban := normalize_iban(attributes.get("iban")):
+            self._by_iban.setdefault((account_type, iban), account)
+            self._all_by_iban.setdefault(iban, []).append(account)
+
+        if name := attributes.get("name"):
+            self._by_name.setdefault((account_type, name), account)
+
+    def with_iban(self, iban: str | None) -> list[dict[str, Any]]:
+        """Get all accounts with the given IBAN, of any type."""
+        if not (normalized := normalize_iban(iban)):
+            return []
+        return self._all_by_iban.get(normalized, [])
+
+    def find_counterparty(
+        self, account_type: str, iban: str | None, name: str | None
+    ) -> tuple[dict[str, Any] | None, str | None]:
+        """Find the account of a counterparty and tell how it was matched.
+
+        The IBAN takes precedence. The name is only a fallback, for when the IBAN
+        is unknown to Firefly or the counterparty uses multiple IBANs. Firefly
+        doesn't allow multiple accounts with the same name, so this is safe.
+        """
+        if (normalized := normalize_iban(iban)) and (
+            account := self._by_iban.get((account_type, normalized))
+        ):
+            return account, "iban"
+
+        if name and (account := self._by_name.get((account_type, name))):
+            return account, "name"
+
+        return None, None
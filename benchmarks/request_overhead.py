@@ -0,0 +1,120 @@
+"""Micro-benchmark of the per-request overhead of the API clients.
+
+The HTTP transport is mocked, so the numbers only reflect the work done by
+TrueLayerClient._request and FireflyClient._request around the actual call.
+Rate limiting and the daily call budget are disabled for the benchmark.
+
+Run it as a module from the repository root, so the clients can be imported:
+
+    python -m benchmarks.request_overhead
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from functools import partial
+from pathlib import Path
+import tempfile
+import time
+from typing import Any
+
+import httpx
+
+from clients.firefly import FireflyClient
+from clients.truelayer import TrueLayerClient
+from config import Config
+
+REQUESTS = 1000
+ROUNDS = 7
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    """Answer every request with an empty JSON document."""
+    return httpx.Response(200, json={}, request=request)
+
+
+class _StubClient:
+    """Stand-in for httpx.AsyncClient which skips httpx altogether."""
+
+    def __init__(self) -> None:
+        self._response = httpx.Response(
+            200, json={}, request=httpx.Request("GET", "http://localhost")
+        )
+
+    async def request(self, **_kwargs: Any) -> httpx.Response:
+        """Return the prepared response."""
+        return self._response
+
+    async def aclose(self) -> None:
+        """Nothing to close."""
+
+
+async def _timeit(request: Callable[[], Awaitable[Any]]) -> float:
+    """Get the best average duration of a request over several rounds, in µs."""
+    for _ in range(100):
+        await request()
+
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            await request()
+        best = min(best, (time.perf_counter() - start) / REQUESTS * 1_000_000)
+    return best
+
+
+async def main() -> None:
+    """Run the benchmark against an isolated configuration."""
+    with tempfile.TemporaryDirectory() as directory:
+        config = Config(Path(directory) / "config.json")
+        config.update(
+            {
+                "truelayer_access_token": "access_token",
+                "truelayer_refresh_token": "refresh_token",
+                "truelayer_expiration_date": time.time() + 3600,
+                "firefly_api_url": "http://firefly.local",
+                "firefly_access_token": "access_token",
+                "truelayer_rate_limit": 0,
+                "firefly_rate_limit": 0,
+                "truelayer_daily_call_budget": 0,
+            }
+        )
+        config.flush()
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_handler)) as client:
+            baseline = await _timeit(
+                lambda: client.request(
+                    "GET",
+                    "http://firefly.local/api/v1/accounts",
+                    headers={"Authorization": "Bearer access_token"},
+                    params={"page": 1},
+                )
+            )
+        print(f"httpx: {baseline:.1f} µs per request")
+
+        for name, api_client in (
+            ("TrueLayer", TrueLayerClient(config=config)),
+            ("Firefly", FireflyClient(config=config)),
+        ):
+            request = partial(
+                api_client._request, "accounts", params={"page": 1, "type": None}
+            )
+
+            api_client._client = _StubClient()
+            overhead = await _timeit(request)
+
+            api_client._client = httpx.AsyncClient(
+                transport=httpx.MockTransport(_handler)
+            )
+            per_request = await _timeit(request)
+            await api_client.close()
+
+            print(
+                f"{name}: {per_request:.1f} µs per request, "
+                f"{overhead:.1f} µs client overhead"
+            )
+
+        config.flush()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
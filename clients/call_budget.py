@@ -0,0 +1,146 @@
+"""Daily call budget for the TrueLayer Data API.
+
+European (PSD2/XS2A) providers only allow a few unattended calls per endpoint per
+day, typically four. The budget keeps track of the calls made today, per provider
+and per endpoint. The counters are kept in memory and stored in the config a few
+seconds after a call, once for a burst of calls, so they survive restarts.
+"""
+
+import asyncio
+from datetime import UTC, datetime
+import logging
+from typing import Any
+
+from config import Config
+
+_LOGGER = logging.getLogger(__name__)
+
+CALL_BUDGET_KEY = "truelayer_call_budget"
+DEFAULT_DAILY_CALL_BUDGET = 4
+DEFAULT_CALL_BUDGET_RESERVE = 1
+# Seconds between a call and storing the counters, calls in between share the write
+SAVE_DELAY = 5.0
+
+
+def _copy(budget: dict[str, Any]) -> dict[str, Any]:
+    """Copy the counters, so the config is only changed on `save`."""
+    return {
+        "date": budget.get("date"),
+        "calls": {
+            provider: dict(calls) for provider, calls in budget.get("calls", {}).items()
+        },
+    }
+
+
+class CallBudget:
+    """Persistent per-provider, per-endpoint daily call counter."""
+
+    def __init__(self, config: Config) -> None:
+        """Initialize the call budget."""
+        self._config = config
+        # Counters of today, read from the config on first use
+        self._budget: dict[str, Any] | None = None
+        self._dirty = False
+        self._save_handle: asyncio.TimerHandle | None = None
+
+    @property
+    def daily_budget(self) -> int:
+        """Get the number of calls allowed per endpoint per day."""
+        return int(
+            self._config.get("truelayer_daily_call_budget", DEFAULT_DAILY_CALL_BUDGET)
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Check if the calls are limited, a budget of 0 or less disables it."""
+        return self.daily_budget > 0
+
+    @property
+    def reserve(self) -> int:
+        """Get the number of calls kept for essential calls, like imports."""
+        return int(
+            self._config.get(
+                "truelayer_call_budget_reserve", DEFAULT_CALL_BUDGET_RESERVE
+            )
+        )
+
+    @property
+    def provider(self) -> str:
+        """Get the provider the calls are counted for."""
+        return (
+            self._config.get("truelayer_provider_id")
+            or self._config.get("truelayer_credentials_id")
+            or "default"
+        )
+
+    def _today(self) -> dict[str, Any]:
+        """Get the counters of today, starting over on a new (UTC) day."""
+        today = datetime.now(UTC).date().isoformat()
+        if self._budget is None:
+            self._budget = _copy(self._config.get(CALL_BUDGET_KEY) or {})
+        if self._budget.get("date") != today:
+            self._budget = {"date": today, "calls": {}}
+        return self._budget
+
+    def used(self, endpoint: str) -> int:
+        """Get the number of calls made to an endpoint today."""
+        return self._today()["calls"].get(self.provider, {}).get(endpoint, 0)
+
+    def remaining(self, endpoint: str) -> int:
+        """Get the number of calls left for an endpoint today."""
+        return max(self.daily_budget - self.used(endpoint), 0)
+
+    def nearly_exhausted(self, endpoint: str) -> bool:
+        """Check if only the reserved calls are left for an endpoint."""
+        if not self.enabled:
+            return False
+        return self.remaining(endpoint) <= self.reserve
+
+    def record(self, endpoint: str) -> None:
+        """Count a call to an endpoint, storing the counters shortly after."""
+        provider_calls = self._today()["calls"].setdefault(self.provider, {})
+        provider_calls[endpoint] = provider_calls.get(endpoint, 0) + 1
+        self._dirty = True
+        self._schedule_save()
+
+        if self.enabled and provider_calls[endpoint] > self.daily_budget:
+            _LOGGER.warning(
+                "Daily call budget of %s exceeded for %s on %s (%s calls today), "
+                "the provider might reject unattended calls",
+                self.daily_budget,
+                endpoint,
+                self.provider,
+                provider_calls[endpoint],
+            )
+
+    def _schedule_save(self) -> None:
+        """Store the counters after a delay on the event loop, or right away."""
+        if self._save_handle is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        self._save_handle = loop.call_later(SAVE_DELAY, self.save)
+
+    def save(self) -> None:
+        """Store the counters in the config, when calls were made."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if not self._dirty:
+            return
+        self._config.update({CALL_BUDGET_KEY: _copy(self._today())})
+        self._dirty = False
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the usage of today."""
+        budget = self._today()
+        return {
+            "date": budget["date"],
+            "daily_budget": self.daily_budget,
+            "reserve": self.reserve,
+            "calls": budget["calls"],
+        }
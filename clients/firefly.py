@@ -1,19 +1,37 @@
 """Class to handle TrueLayer API calls."""
 
+import asyncio
+from collections.abc import Mapping
+from datetime import date
 import logging
+from types import MappingProxyType
 from typing import Any, Self
 
 import httpx
 from yarl import URL
-from config import Config
+from clients.http_client import ConnectionStats, create_http_client, get_setting
+from clients.retry import RetryPolicy, TokenBucket, send_with_retry
+from config import Config, get_config
 
 from exceptions import (
+    TrueLayer2FireflyBadRequestError,
     TrueLayer2FireflyConnectionError,
+    TrueLayer2FireflyDuplicateError,
     TrueLayer2FireflyError,
 )
 
 _LOGGER = logging.getLogger(__name__)
 
+DEFAULT_HEADERS: Mapping[str, str] = MappingProxyType(
+    {
+        "Accept": "application/json",
+        "User-Agent": "TrueLayer2Firefly",
+    }
+)
+FORM_HEADERS: Mapping[str, str] = MappingProxyType(
+    {"Content-Type": "application/x-www-form-urlencoded"}
+)
+
 
 class FireflyClient:
     """Firefly client for making API calls"""
@@ -23,9 +41,10 @@ class FireflyClient:
         request_timeout: float = 10.0,
         url: str | None = None,
         access_token: str | None = None,
+        config: Config | None = None,
     ):
         """Initialize the Firefly client"""
-        self._config: Config = Config()
+        self._config: Config = config or get_config()
 
         self.url: str | None = self._config.get("firefly_api_url") or url
         self.access_token: str | None = (
@@ -34,6 +53,45 @@ class FireflyClient:
 
         self._request_timeout: float = request_timeout
         self._client: httpx.AsyncClient | None = None
+        self.connection_stats = ConnectionStats()
+        self._retry_policy = RetryPolicy.from_config(self._config, "firefly")
+        self._rate_limiter = TokenBucket.from_config(
+            self._config, "firefly", rate=25, capacity=50
+        )
+
+        self._page_size: int | None = get_setting(
+            self._config, "firefly_page_size", None, int
+        )
+        self._page_concurrency: int = max(
+            get_setting(self._config, "firefly_page_concurrency", 4, int), 1
+        )
+
+        self._context_key: tuple[str | None, str | None] | None = None
+        self._context: tuple[str, str, Mapping[str, str]] = ("", "", DEFAULT_HEADERS)
+
+    def _request_context(self) -> tuple[str, str, Mapping[str, str]]:
+        """Get the base URLs and headers, only rebuilt when URL or token change."""
+        # The client is long-lived, so pick up reconfigurations from the config
+        self.access_token = (
+            self._config.get("firefly_access_token") or self.access_token
+        )
+        self.url = self._config.get("firefly_api_url") or self.url
+
+        key = (self.url, self.access_token)
+        if key != self._context_key:
+            assert self.url, "Firefly API URL is not set"
+            base = URL(self.url)
+            headers = dict(DEFAULT_HEADERS)
+            if self.access_token:
+                headers["Authorization"] = f"Bearer {self.access_token}"
+
+            self._context_key = key
+            self._context = (
+                str(base.join(URL("."))),
+                str(base.join(URL("api/v1/"))),
+                MappingProxyType(headers),
+            )
+        return self._context
 
     async def _request(
         self,
@@ -43,72 +101,47 @@ class FireflyClient:
         method: str = "GET",
         params: dict[str, Any] | None = None,
         json: dict[str, Any] | None = None,
+        idempotent: bool | None = None,
     ) -> Any:
         """Make a request to the Firefly API"""
-        if not self.access_token:
-            self.access_token = self._config.get("firefly_access_token")
-
-        if not self.url:
-            self.url = self._config.get("firefly_api_url")
-
         # No refresh mechanism is needed, since the token is valid for 55 years
-
-        assert self.url, "Firefly API URL is not set"
-        if auth:
-            url = str(URL(self.url).join(URL(uri)))
-        else:
-            url = str(URL(self.url).join(URL(f"api/v1/{uri}")))
-
-        headers = {
-            "Accept": "application/json",
-            "User-Agent": "TrueLayer2Firefly",
-        }
-
-        if self.access_token:
-            headers["Authorization"] = f"Bearer {self.access_token}"
+        root_url, api_url, headers = self._request_context()
+        url = f"{root_url}{uri}" if auth else f"{api_url}{uri}"
 
         if self._client is None:
-            self._client = httpx.AsyncClient(timeout=self._request_timeout)
+            self._client = self._create_http_client()
 
-        if params:
+        if params and None in params.values():
             params = {k: v for k, v in params.items() if v is not None}
-        if json:
+        if json and None in json.values():
             json = {k: v for k, v in json.items() if v is not None}
 
         try:
             if method == "POST" and auth:
-                headers = {"Content-Type": "application/x-www-form-urlencoded"}
-                response = await self._client.request(
+                response = await self._send(
                     method=method,
+                    idempotent=idempotent,
                     url=url,
-                    headers=headers,
+                    headers=FORM_HEADERS,
                     data=params,
                 )
             elif method == "POST" and not auth:
-                if self._config.get("firefly_access_token"):
-                    headers["Authorization"] = (
-                        f"Bearer {self._config.get('firefly_access_token')}"
-                    )
-                headers["Content-Type"] = "application/json"
-                response = await self._client.request(
+                response = await self._send(
                     method=method,
+                    idempotent=idempotent,
                     url=url,
                     headers=headers,
                     json=json,
                 )
             else:
-                if self._config.get("firefly_access_token"):
-                    headers["Authorization"] = (
-                        f"Bearer {self._config.get('firefly_access_token')}"
-                    )
-
-                _LOGGER.debug("URL: %s", url)
-                response = await self._client.request(
+                if _LOGGER.isEnabledFor(logging.DEBUG):
+                    _LOGGER.debug("URL: %s", url)
+                response = await self._send(
                     method=method,
+                    idempotent=idempotent,
                     url=url,
                     headers=headers,
                     params=params if method == "GET" else None,
-                    json=json if method == "POST" and not auth else None,
                 )
             response.raise_for_status()
         except httpx.RequestError as err:
@@ -116,6 +149,14 @@ class FireflyClient:
             raise TrueLayer2FireflyConnectionError(msg) from err
         except httpx.HTTPStatusError as err:
             msg = f"HTTP status error during {method} {url}: {err.response.status_code}, {err.response.text}"
+            # Firefly answers error_if_duplicate_hash with a validation error
+            if (
+                err.response.status_code == 422
+                and "Duplicate of transaction" in err.response.text
+            ):
+                raise TrueLayer2FireflyDuplicateError(msg) from err
+            if err.response.status_code in (404, 422):
+                raise TrueLayer2FireflyBadRequestError(msg) from err
             raise TrueLayer2FireflyConnectionError(msg) from err
 
         content_type = response.headers.get("Content-Type", "")
@@ -145,40 +186,91 @@ class FireflyClient:
             method="GET",
         )
 
-    async def get_account_paginated(self) -> dict[str, Any]:
-        """Get the accounts from the Firefly API with pagination."""
-        accounts = []
-        next_page = 1
+    async def _get_page(
+        self, uri: str, page: int, params: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Get a single page of a list from the Firefly API."""
+        response = await self._request(
+            uri=uri,
+            method="GET",
+            params={**params, "page": page},
+        )
 
-        while next_page:
-            response = await self._request(
-                uri="accounts",
-                method="GET",
-                params={"page": next_page},
+        if response.status_code != 200:
+            _LOGGER.error("Error fetching %s from Firefly: %s", uri, response.text)
+            raise TrueLayer2FireflyError(
+                f"Error fetching {uri} from Firefly",
+                {"response": response.text},
             )
 
-            if response.status_code != 200:
-                _LOGGER.error("Error fetching accounts from Firefly: %s", response.text)
-                raise TrueLayer2FireflyError(
-                    "Error fetching accounts from Firefly",
-                    {"response": response.text},
-                )
+        return response.json()
+
+    async def _get_paginated(
+        self, uri: str, params: dict[str, Any]
+    ) -> list[dict[str, Any]]:
+        """Get all items of a list from the Firefly API.
 
-            data = response.json()
-            if "data" not in data:
-                _LOGGER.warning("No accounts found in Firefly")
-                break
+        The first page tells how many pages there are, the remaining pages are
+        fetched concurrently.
+        """
+        params = {**params, "limit": params.get("limit") or self._page_size}
+        data = await self._get_page(uri, 1, params)
+        if "data" not in data:
+            _LOGGER.warning("No %s found in Firefly", uri)
+            return []
 
-            accounts.extend(data["data"])
+        items = list(data["data"])
+        total_pages = data.get("meta", {}).get("pagination", {}).get("total_pages", 1)
+        if total_pages <= 1:
+            return items
 
-            # Check for the next page in the pagination metadata
-            pagination = data.get("meta", {}).get("pagination", {})
-            current_page = pagination.get("current_page", 1)
-            total_pages = pagination.get("total_pages", 1)
+        semaphore = asyncio.Semaphore(self._page_concurrency)
 
-            next_page = current_page + 1 if current_page < total_pages else None
+        async def fetch(page: int) -> dict[str, Any]:
+            async with semaphore:
+                return await self._get_page(uri, page, params)
 
-        return accounts
+        # Gather keeps the order of the pages, and with it the order of the items
+        for page_data in await asyncio.gather(
+            *(fetch(page) for page in range(2, total_pages + 1))
+        ):
+            items.extend(page_data.get("data", []))
+
+        return items
+
+    async def get_account_count(self, account_type: str | None = None) -> int:
+        """Get the number of accounts, by requesting a single account."""
+        data = await self._get_page("accounts", 1, {"type": account_type, "limit": 1})
+        return data.get("meta", {}).get("pagination", {}).get("total", 0)
+
+    async def get_account_paginated(
+        self, account_type: str | None = None, limit: int | None = None
+    ) -> list[dict[str, Any]]:
+        """Get the accounts from the Firefly API with pagination.
+
+        The accounts can be filtered by type, for example `asset`, `expense` or
+        `revenue`.
+        """
+        return await self._get_paginated(
+            "accounts", {"type": account_type, "limit": limit}
+        )
+
+    async def get_account_transactions(
+        self,
+        account_id: str,
+        start: date | None = None,
+        end: date | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """Get the transactions of an account within a date range."""
+        return await self._get_paginated(
+            f"accounts/{account_id}/transactions",
+            {
+                "start": start.isoformat() if start else None,
+                "end": end.isoformat() if end else None,
+                "limit": limit,
+            },
+        )
 
     async def create_account(
         self,
@@ -197,25 +289,52 @@ class FireflyClient:
         self,
         transaction_data: dict[str, Any],
     ) -> dict[str, Any]:
-        """Create a transaction in Firefly."""
+        """Create a transaction in Firefly.
+
+        With `error_if_duplicate_hash`, Firefly rejects a transaction it already
+        stored, which makes it safe to retry the request after a server error.
+        """
         response = await self._request(
             uri="transactions",
             method="POST",
             json=transaction_data,
+            idempotent=bool(transaction_data.get("error_if_duplicate_hash")),
         )
 
         return response
 
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """Create the HTTPX client with the configured connection pool."""
+        return create_http_client(
+            self._config, "firefly", self._request_timeout, self.connection_stats
+        )
+
+    async def _send(
+        self, method: str, url: str, idempotent: bool | None = None, **kwargs: Any
+    ) -> httpx.Response:
+        """Send a request through the retry policy and the rate limiter."""
+        assert self._client is not None
+        return await send_with_retry(
+            self._client,
+            method,
+            url,
+            policy=self._retry_policy,
+            limiter=self._rate_limiter,
+            idempotent=idempotent,
+            **kwargs,
+        )
+
     async def close(self) -> None:
         """Close the HTTPX client session."""
         if self._client:
             await self._client.aclose()
+            self._client = None
             _LOGGER.info("Closed Firefly HTTPX client session")
 
     async def __aenter__(self) -> Self:
         """Async enter."""
         if self._client is None:
-            self._client = httpx.AsyncClient(timeout=self._request_timeout)
+            self._client = self._create_http_client()
         return self
 
     async def __aexit__(self, *_exc_info: object) -> None:
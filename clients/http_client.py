@@ -0,0 +1,143 @@
+"""Shared HTTPX client construction for the API clients."""
+
+from collections import deque
+from dataclasses import dataclass, field
+import importlib.util
+import logging
+import os
+import time
+from typing import Any, Callable
+
+import httpx
+
+from config import Config
+
+_LOGGER = logging.getLogger(__name__)
+
+TRUTHY = {"1", "true", "yes", "on"}
+# Latencies kept per client, enough for the requests of a large import
+LATENCY_SAMPLES = 10000
+
+
+@dataclass
+class ConnectionStats:
+    """Connection reuse statistics of an HTTPX client."""
+
+    requests: int = 0
+    new_connections: int = 0
+    responses: int = 0
+    latencies: deque[float] = field(
+        default_factory=lambda: deque(maxlen=LATENCY_SAMPLES)
+    )
+
+    def record_latency(self, seconds: float) -> None:
+        """Record the time it took to receive the response to a request."""
+        self.responses += 1
+        self.latencies.append(seconds)
+
+    def latencies_since(self, responses: int) -> list[float]:
+        """Get the latencies recorded after the given number of responses."""
+        count = min(self.responses - responses, len(self.latencies))
+        return list(self.latencies)[len(self.latencies) - count :]
+
+    @property
+    def reused_connections(self) -> int:
+        """Get the number of requests sent over an already open connection."""
+        return max(self.requests - self.new_connections, 0)
+
+    def as_dict(self) -> dict[str, int]:
+        """Get the statistics as a dictionary."""
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+        }
+
+
+def _to_bool(value: Any) -> bool:
+    """Convert a configuration or environment value to a boolean."""
+    if isinstance(value, str):
+        return value.strip().lower() in TRUTHY
+    return bool(value)
+
+
+def get_setting(
+    config: Config, key: str, default: Any, cast: Callable[[Any], Any]
+) -> Any:
+    """Get a setting from the config, falling back to the environment.
+
+    The environment variable is the upper case version of the key, for example
+    `firefly_http2` can also be set through `FIREFLY_HTTP2`.
+    """
+    value = config.get(key)
+    if value is None:
+        value = os.environ.get(key.upper())
+    if value is None or value == "":
+        return default
+
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        _LOGGER.warning("Invalid value %r for %s, using %s", value, key, default)
+        return default
+
+
+def create_http_client(
+    config: Config,
+    prefix: str,
+    request_timeout: float,
+    stats: ConnectionStats,
+) -> httpx.AsyncClient:
+    """Create an HTTPX client with the pool settings of the given API.
+
+    All settings are optional and read as `<prefix>_http_<setting>`, for example
+    `firefly_http_max_connections`. Timeouts default to the request timeout.
+    """
+
+    def setting(name: str, default: Any, cast: Callable[[Any], Any] = float) -> Any:
+        return get_setting(config, f"{prefix}_http_{name}", default, cast)
+
+    limits = httpx.Limits(
+        max_connections=setting("max_connections", 100, int),
+        max_keepalive_connections=setting("max_keepalive_connections", 20, int),
+        keepalive_expiry=setting("keepalive_expiry", 5.0),
+    )
+    timeout = httpx.Timeout(
+        connect=setting("connect_timeout", request_timeout),
+        read=setting("read_timeout", request_timeout),
+        write=setting("write_timeout", request_timeout),
+        pool=setting("pool_timeout", request_timeout),
+    )
+
+    http2 = get_setting(config, f"{prefix}_http2", False, _to_bool)
+    if http2 and importlib.util.find_spec("h2") is None:
+        _LOGGER.warning(
+            "HTTP/2 requested for %s, but the h2 package is not installed. "
+            "Install httpx[http2] to enable it, falling back to HTTP/1.1",
+            prefix,
+        )
+        http2 = False
+
+    async def on_request(request: httpx.Request) -> None:
+        """Attach the connection tracer to every outgoing request."""
+        stats.requests += 1
+        started = time.monotonic()
+
+        async def trace(event: str, _info: dict[str, Any]) -> None:
+            """Count the new connections and time the response headers."""
+            if event == "connection.connect_tcp.complete":
+                stats.new_connections += 1
+            elif event.endswith(".receive_response_headers.complete"):
+                stats.record_latency(time.monotonic() - started)
+
+        request.extensions["trace"] = trace
+
+    _LOGGER.info(
+        "Creating %s HTTP client: %s, %s, http2=%s", prefix, limits, timeout, http2
+    )
+    return httpx.AsyncClient(
+        timeout=timeout,
+        limits=limits,
+        http2=http2,
+        event_hooks={"request": [on_request]},
+    )
@@ -0,0 +1,202 @@
+"""Retry and rate limiting for the upstream API calls."""
+
+import asyncio
+from collections.abc import Callable
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import time
+from typing import Any, Self
+
+import httpx
+
+from clients.http_client import get_setting
+from config import Config
+
+_LOGGER = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Errors raised before the request reached the server, safe to retry for any method
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a Retry-After header, either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=UTC)
+    return max((retry_at - datetime.now(UTC)).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honoring Retry-After."""
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ) -> None:
+        """Initialize the retry policy."""
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config: Config, prefix: str) -> Self:
+        """Create the retry policy from the `<prefix>_retry_*` settings."""
+        return cls(
+            attempts=get_setting(config, f"{prefix}_retry_attempts", 3, int),
+            base_delay=get_setting(config, f"{prefix}_retry_base_delay", 0.5, float),
+            max_delay=get_setting(config, f"{prefix}_retry_max_delay", 30.0, float),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Get a jittered exponential backoff delay for the given attempt."""
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    def retry_delay(
+        self, err: httpx.HTTPError, attempt: int, idempotent: bool
+    ) -> tuple[float, bool] | None:
+        """Get the delay before the next attempt, or None to give up.
+
+        The second value tells whether the delay was requested by the server.
+        """
+        if attempt >= self.attempts:
+            return None
+
+        if isinstance(err, httpx.HTTPStatusError):
+            status = err.response.status_code
+            if status not in RETRYABLE_STATUS_CODES:
+                return None
+            # A 429 means the request was not processed, so it is always safe
+            if status != 429 and not idempotent:
+                return None
+
+            retry_after = parse_retry_after(err.response.headers.get("Retry-After"))
+            if retry_after is not None:
+                if retry_after > self.max_delay:
+                    return None
+                return retry_after, True
+            return self.backoff(attempt), False
+
+        if isinstance(err, NOT_SENT_ERRORS) or (
+            idempotent and isinstance(err, httpx.TransportError)
+        ):
+            return self.backoff(attempt), False
+        return None
+
+
+class TokenBucket:
+    """Token bucket limiting the request rate towards a single upstream."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Initialize the token bucket, a rate of 0 disables limiting."""
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_config(
+        cls, config: Config, prefix: str, rate: float, capacity: float
+    ) -> Self:
+        """Create the token bucket from the `<prefix>_rate_*` settings."""
+        return cls(
+            rate=get_setting(config, f"{prefix}_rate_limit", rate, float),
+            capacity=get_setting(config, f"{prefix}_rate_burst", capacity, float),
+        )
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all requests, for example when the server sent Retry-After."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        if self.rate <= 0 and self._paused_until <= time.monotonic():
+            return
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def send_with_retry(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    *,
+    policy: RetryPolicy,
+    limiter: TokenBucket | None = None,
+    idempotent: bool | None = None,
+    on_attempt: Callable[[], None] | None = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Send a request, retrying transient failures according to the policy.
+
+    The response is returned after `raise_for_status`, so the last HTTPX error is
+    raised when all attempts failed. `on_attempt` is called for every attempt
+    sent, retries included.
+    """
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+
+    attempt = 0
+    while True:
+        attempt += 1
+        if limiter is not None:
+            await limiter.acquire()
+        if on_attempt is not None:
+            on_attempt()
+        try:
+            response = await client.request(method=method, url=url, **kwargs)
+            response.raise_for_status()
+        except (httpx.HTTPStatusError, httpx.TransportError) as err:
+            retry = policy.retry_delay(err, attempt, idempotent)
+            if retry is None:
+                raise
+            delay, requested_by_server = retry
+            if requested_by_server and limiter is not None:
+                limiter.pause(delay)
+            _LOGGER.warning(
+                "%s %s failed (%s), retrying in %.1fs (attempt %s of %s)",
+                method,
+                url,
+                err,
+                delay,
+                attempt + 1,
+                policy.attempts,
+            )
+            await asyncio.sleep(delay)
+            continue
+        return response
@@ -1,15 +1,22 @@
 """Class to handle TrueLayer API calls."""
 
-from datetime import datetime
+import asyncio
+from collections.abc import Mapping
+from datetime import UTC, datetime
+from functools import partial
 import logging
 import time
+from types import MappingProxyType
 from typing import Any, Self
 import humanize
 
 import httpx
 from yarl import URL
 import jwt
-from config import Config
+from clients.call_budget import CallBudget
+from clients.http_client import ConnectionStats, create_http_client
+from clients.retry import RetryPolicy, TokenBucket, send_with_retry
+from config import Config, get_config
 
 from exceptions import (
     TrueLayer2FireflyConnectionError,
@@ -19,6 +26,26 @@ from exceptions import (
 
 _LOGGER = logging.getLogger(__name__)
 
+# Refresh on the request path when the token expires within this many seconds
+TOKEN_EXPIRY_MARGIN = 30
+# The background refresher renews the token this many seconds before expiry
+PROACTIVE_REFRESH_LEAD = 300
+# Interval to re-check when there is no token or a refresh failed
+PROACTIVE_REFRESH_RETRY = 60
+
+API_URL = "https://api.truelayer.com/data/v1/"
+AUTH_URL = "https://auth.truelayer.com/"
+
+DEFAULT_HEADERS: Mapping[str, str] = MappingProxyType(
+    {
+        "Accept": "application/json",
+        "User-Agent": "TrueLayer2Firefly",
+    }
+)
+FORM_HEADERS: Mapping[str, str] = MappingProxyType(
+    {"Content-Type": "application/x-www-form-urlencoded"}
+)
+
 
 class TrueLayerClient:
     """TrueLayer client for making API calls"""
@@ -29,9 +56,10 @@ class TrueLayerClient:
         client_id: str | None = None,
         client_secret: str | None = None,
         redirect_uri: str | None = None,
+        config: Config | None = None,
     ):
         """Initialize the TrueLayer client"""
-        self._config = Config()
+        self._config: Config = config or get_config()
         self.client_id: str | None = (
             self._config.get("truelayer_client_id") or client_id
         )
@@ -47,16 +75,32 @@ class TrueLayerClient:
 
         self._request_timeout = request_timeout
         self._client: httpx.AsyncClient | None = None
+        self.connection_stats = ConnectionStats()
+        self.call_budget = CallBudget(self._config)
+        # Last responses of the Data API, served when the call budget runs low
+        self._response_cache: dict[str, httpx.Response] = {}
+        self._retry_policy = RetryPolicy.from_config(self._config, "truelayer")
+        self._rate_limiter = TokenBucket.from_config(
+            self._config, "truelayer", rate=5, capacity=10
+        )
+
+        # Expiry of the access token, decoded once from the JWT and kept in memory
+        self._expires_at: float | None = self._config.get("truelayer_expiration_date")
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+        # Request headers including the bearer token, rebuilt when the token changes
+        self._headers_token: str | None = None
+        self._headers: Mapping[str, str] = DEFAULT_HEADERS
 
     @property
     def lifetime(self) -> str | None:
         """Get the lifetime of the access token"""
-        if not self._config.get("truelayer_expiration_date"):  # TODO: Fix this
+        if not self._expires_at:
             _LOGGER.warning("Expiration date not set in the config")
             return None
         return humanize.naturaldelta(
-            datetime.fromtimestamp(self._config.get("truelayer_expiration_date"))
-            - datetime.now()
+            datetime.fromtimestamp(self._expires_at) - datetime.now()
         )
 
     @property
@@ -77,60 +121,45 @@ class TrueLayerClient:
         method: str = "GET",
         params: dict[str, Any] | None = None,
         json: dict[str, Any] | None = None,
+        idempotent: bool | None = None,
     ) -> Any:
         """Make a request to the TrueLayer API"""
-        self.access_token = self._config.get("truelayer_access_token")
-        self.client_id = self._config.get("truelayer_client_id")
-        self.client_secret = self._config.get("truelayer_client_secret")
-        self.redirect_uri = self._config.get("truelayer_redirect_uri")
-
-        if auth:
-            url = str(URL("https://auth.truelayer.com").join(URL(uri)))
-        else:
-            url = str(
-                URL("https://api.truelayer.com/data/v1/").join(URL(uri.lstrip("/")))
-            )
-
-        headers = {
-            "Accept": "application/json",
-            "User-Agent": "TrueLayer2Firefly",
-        }
-
-        if self.access_token:
-            headers["Authorization"] = f"Bearer {self.access_token}"
+        endpoint = uri.lstrip("/")
+        url = f"{AUTH_URL if auth else API_URL}{endpoint}"
 
         if self._client is None:
-            self._client = httpx.AsyncClient(timeout=self._request_timeout)
+            self._client = self._create_http_client()
 
         await self._refresh_token()
 
         # Sanitize params and json by removing None values
-        if params:
+        if params and None in params.values():
             params = {k: v for k, v in params.items() if v is not None}
-        if json:
+        if json and None in json.values():
             json = {k: v for k, v in json.items() if v is not None}
 
+        debug = _LOGGER.isEnabledFor(logging.DEBUG)
         try:
             if method == "POST" and auth:
-                _LOGGER.debug("Sending POST request with form-encoded data")
-                headers = {"Content-Type": "application/x-www-form-urlencoded"}
-                response = await self._client.request(
+                if debug:
+                    _LOGGER.debug("Sending POST request with form-encoded data")
+                response = await self._send(
                     method=method,
+                    idempotent=idempotent,
                     url=url,
-                    headers=headers,
+                    endpoint=endpoint,
+                    headers=FORM_HEADERS,
                     data=params,
                 )
             else:
-                if self._config.get("truelayer_access_token"):
-                    headers["Authorization"] = (
-                        f"Bearer {self._config.get('truelayer_access_token')}"
-                    )
-
-                _LOGGER.debug("URL: %s", url)
-                response = await self._client.request(
+                if debug:
+                    _LOGGER.debug("URL: %s", url)
+                response = await self._send(
                     method=method,
+                    idempotent=idempotent,
                     url=url,
-                    headers=headers,
+                    endpoint=endpoint,
+                    headers=self._bearer_headers(),
                     params=params if method == "GET" else None,
                     json=json if method == "POST" and not auth else None,
                 )
@@ -155,22 +184,51 @@ class TrueLayerClient:
 
         return response
 
-    async def _refresh_token(self) -> None:
-        """Refresh the access token if it is expired."""
+    def _bearer_headers(self) -> Mapping[str, str]:
+        """Get the request headers, only rebuilt when the access token changes."""
+        token = self._config.get("truelayer_access_token")
+        if token != self._headers_token:
+            self._headers_token = token
+            self.access_token = token
+            self._headers = (
+                MappingProxyType(
+                    {**DEFAULT_HEADERS, "Authorization": f"Bearer {token}"}
+                )
+                if token
+                else DEFAULT_HEADERS
+            )
+        return self._headers
+
+    def _needs_refresh(self, margin: float) -> bool:
+        """Check if the access token expires within the given margin."""
         if not self._config.get("truelayer_refresh_token"):
-            _LOGGER.debug("No refresh token available")
-            return
+            return False
+        return self._expires_at is None or time.time() >= self._expires_at - margin
 
-        _LOGGER.info("Token will expire in %s", self.lifetime)
+    async def _refresh_token(self, margin: float = TOKEN_EXPIRY_MARGIN) -> None:
+        """Refresh the access token if it is (about to be) expired.
 
-        if self._config.get(
-            "truelayer_expiration_date"
-        ) and datetime.now().timestamp() < self._config.get(
-            "truelayer_expiration_date"
-        ):
+        Concurrent callers share a single refresh: the first one performs the
+        round trip while the others wait on the lock and reuse its result.
+        """
+        if not self._needs_refresh(margin):
             _LOGGER.debug("Access token is still valid, no need to refresh")
             return
 
+        async with self._refresh_lock:
+            if not self._needs_refresh(margin):
+                _LOGGER.debug("Access token was refreshed by a concurrent request")
+                return
+
+            await self._do_refresh_token()
+
+    async def _do_refresh_token(self) -> None:
+        """Exchange the refresh token for a new access token."""
+        _LOGGER.info("Token will expire in %s", self.lifetime)
+
+        if self._client is None:
+            self._client = self._create_http_client()
+
         params = {
             "grant_type": "refresh_token",
             "client_id": self._config.get("truelayer_client_id"),
@@ -178,18 +236,14 @@ class TrueLayerClient:
             "refresh_token": self._config.get("truelayer_refresh_token"),
         }
 
-        headers = {
-            "Accept": "application/json",
-            "User-Agent": "TrueLayer2Firefly",
-        }
-
-        url = str(URL("https://auth.truelayer.com/connect/token"))
+        url = f"{AUTH_URL}connect/token"
         try:
             _LOGGER.info("Refreshing access token")
-            response = await self._client.request(
+            response = await self._send(
                 method="POST",
                 url=url,
-                headers=headers,
+                endpoint="connect/token",
+                headers=DEFAULT_HEADERS,
                 json=params,
             )
             response.raise_for_status()
@@ -211,12 +265,12 @@ class TrueLayerClient:
         response = response.json()
 
         _LOGGER.info("Received new access token response: %s", response)
-        self._config.set("truelayer_access_token", response["access_token"])
-        self._config.set("truelayer_refresh_token", response["refresh_token"])
+        with self._config.transaction():
+            self._config.set("truelayer_access_token", response["access_token"])
+            self._config.set("truelayer_refresh_token", response["refresh_token"])
+            self._extract_info_from_token()
 
         self.access_token = response["access_token"]
-
-        await self._extract_info_from_token()
         _LOGGER.info("Access token refreshed successfully")
 
     async def get_authorization_url(self) -> str:
@@ -239,6 +293,9 @@ class TrueLayerClient:
 
     async def exchange_authorization_code(self) -> None:
         """Exchange the authorization code for an access token."""
+        self.client_id = self._config.get("truelayer_client_id")
+        self.client_secret = self._config.get("truelayer_client_secret")
+        self.redirect_uri = self._config.get("truelayer_redirect_uri")
         params = {
             "grant_type": "authorization_code",
             "client_id": self.client_id,
@@ -258,14 +315,14 @@ class TrueLayerClient:
 
         response = response.json()
 
-        self._config.set("truelayer_access_token", response["access_token"])
-        self._config.set("truelayer_refresh_token", response["refresh_token"])
+        with self._config.transaction():
+            self._config.set("truelayer_access_token", response["access_token"])
+            self._config.set("truelayer_refresh_token", response["refresh_token"])
+            self._extract_info_from_token()
 
         self.access_token = response["access_token"]
 
-        await self._extract_info_from_token()
-
-    async def _extract_info_from_token(self) -> None:
+    def _extract_info_from_token(self) -> None:
         """Extract information from the access token."""
         decoded = jwt.decode(
             self._config.get("truelayer_access_token"),
@@ -274,31 +331,139 @@ class TrueLayerClient:
         )
         self._config.set("truelayer_credentials_id", decoded["sub"])
         self._config.set("truelayer_expiration_date", decoded["exp"])
+        self._expires_at = decoded["exp"]
+
+    def start_token_refresher(self) -> None:
+        """Start refreshing the access token in the background before it expires.
+
+        This keeps the auth round trip off the request path.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._token_refresher())
+            _LOGGER.info("TrueLayer token refresher started")
+
+    async def _token_refresher(self) -> None:
+        """Refresh the access token shortly before it expires, forever."""
+        while True:
+            if self._expires_at is None or not self._config.get(
+                "truelayer_refresh_token"
+            ):
+                await asyncio.sleep(PROACTIVE_REFRESH_RETRY)
+                continue
+
+            delay = self._expires_at - PROACTIVE_REFRESH_LEAD - time.time()
+            if delay > 0:
+                # Sleep in bounded steps, a refresh on the request path or a
+                # reconfiguration might have moved the expiry in the meantime
+                await asyncio.sleep(min(delay, PROACTIVE_REFRESH_RETRY))
+                continue
+
+            try:
+                await self._refresh_token(margin=PROACTIVE_REFRESH_LEAD)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error("Proactive token refresh failed: %s", err)
+                await asyncio.sleep(PROACTIVE_REFRESH_RETRY)
+
+    async def get_accounts(self, essential: bool = True) -> dict[str, Any]:
+        """Get the accounts from TrueLayer.
+
+        Non-essential calls, like health checks, are answered from the last
+        response once the daily call budget is nearly used up.
+        """
+        cached = self._response_cache.get("accounts")
+        if (
+            not essential
+            and cached is not None
+            and self.call_budget.nearly_exhausted("accounts")
+        ):
+            _LOGGER.info("Call budget nearly used up, serving accounts from cache")
+            return cached
 
-    async def get_accounts(self) -> dict[str, Any]:
-        """Get the accounts from TrueLayer."""
-        return await self._request(
+        response = await self._request(
             uri="accounts",
             method="GET",
         )
+        self._response_cache["accounts"] = response
+
+        results = response.json().get("results") or []
+        provider_id = (
+            results[0].get("provider", {}).get("provider_id") if results else None
+        )
+        if provider_id and provider_id != self._config.get("truelayer_provider_id"):
+            self._config.set("truelayer_provider_id", provider_id)
+
+        return response
+
+    async def get_transactions(
+        self,
+        account_id: str,
+        from_date: datetime | None = None,
+        to_date: datetime | None = None,
+    ) -> dict[str, Any]:
+        """Get the transactions from TrueLayer.
+
+        Without a date range, the default window of the provider is returned.
+        TrueLayer requires both ends of the range, so `to_date` defaults to now.
+        """
+        params: dict[str, Any] | None = None
+        if from_date is not None:
+            params = {
+                "from": from_date.isoformat(),
+                "to": (to_date or datetime.now(UTC)).isoformat(),
+            }
 
-    async def get_transactions(self, account_id: str) -> dict[str, Any]:
-        """Get the transactions from TrueLayer."""
         return await self._request(
             uri=f"accounts/{account_id}/transactions",
             method="GET",
+            params=params,
+        )
+
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """Create the HTTPX client with the configured connection pool."""
+        return create_http_client(
+            self._config, "truelayer", self._request_timeout, self.connection_stats
+        )
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        endpoint: str,
+        idempotent: bool | None = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """Send a request through the retry policy and the rate limiter.
+
+        Every attempt is counted against the daily call budget of the endpoint.
+        """
+        assert self._client is not None
+        return await send_with_retry(
+            self._client,
+            method,
+            url,
+            policy=self._retry_policy,
+            limiter=self._rate_limiter,
+            idempotent=idempotent,
+            on_attempt=partial(self.call_budget.record, endpoint),
+            **kwargs,
         )
 
     async def close(self) -> None:
         """Close the HTTPX client session."""
+        self.call_budget.save()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
         if self._client:
             await self._client.aclose()
+            self._client = None
             _LOGGER.info("Closed HTTPX client session")
 
     async def __aenter__(self) -> Self:
         """Async enter."""
         if self._client is None:
-            self._client = httpx.AsyncClient(timeout=self._request_timeout)
+            self._client = self._create_http_client()
         return self
 
     async def __aexit__(self, *_exc_info: object) -> None:
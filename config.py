@@ -1,51 +1,111 @@
 """Class to handle the configuration for Plaid2Firefly"""
 
+import asyncio
+from collections.abc import Iterator
+from contextlib import contextmanager
 import json
+import os
 from pathlib import Path
+import time
 from typing import Any
 
 import logging
 
 _LOGGER = logging.getLogger(__name__)
 
+# Minimum number of seconds between two checks for changes on disk
+CHECK_INTERVAL = 1.0
+
 
 class Config:
     """Configuration class for Plaid2Firefly"""
 
-    def __init__(self) -> None:
-        self.path = Path("data/config.json")
+    def __init__(
+        self, path: Path | None = None, check_interval: float = CHECK_INTERVAL
+    ) -> None:
+        self.path = path or Path("data/config.json")
+        self._config: dict[str, Any] = {}
+        self._signature: tuple[int, int, int] | None = None
+        self._check_interval = check_interval
+        self._checked_at: float = 0.0
+        self._disk_reads: int = 0
+        self._disk_writes: int = 0
+        self._dirty: bool = False
+        self._batch_depth: int = 0
+        self._flush_scheduled: bool = False
         if not self.path.exists():
             _LOGGER.info("Creating configuration file at %s", self.path)
             self.path.write_text("{}", encoding="utf-8")
         self._load()
 
+    @property
+    def disk_reads(self) -> int:
+        """Get the number of times the configuration file was read from disk"""
+        return self._disk_reads
+
+    @property
+    def disk_writes(self) -> int:
+        """Get the number of times the configuration file was written to disk"""
+        return self._disk_writes
+
+    def _stat_signature(self) -> tuple[int, int, int] | None:
+        """Get a cheap signature of the configuration file to detect changes"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
     def _load(self) -> None:
         """Load the configuration from the JSON file"""
         with open(self.path, "r", encoding="utf-8") as f:
             self._config = json.load(f)
+        self._signature = self._stat_signature()
+        self._disk_reads += 1
+        _LOGGER.debug("Loaded configuration from %s", self.path)
+
+    def _refresh(self) -> None:
+        """Reload the configuration only when the file changed on disk"""
+        if self._dirty:
+            # Never discard pending changes which are not flushed yet
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self._check_interval:
+            return
+        self._checked_at = now
+
+        signature = self._stat_signature()
+        if signature is None:
+            _LOGGER.warning("Configuration file %s disappeared", self.path)
+            return
+        if signature != self._signature:
+            self._load()
 
     def get(self, key: str, default=None) -> Any:
         """Get a configuration value, always using the latest available"""
-        self._load()
+        self._refresh()
         return self._config.get(key, default)
 
     def set(self, key: str, value: Any) -> None:
         """Set a configuration value"""
+        self._refresh()
         self._config[key] = value
         _LOGGER.info("Saving configuration: %s to %s", key, value)
-        self._save()
+        self._commit()
 
     def update(self, new_values: dict) -> None:
         """Update multiple configuration values"""
+        self._refresh()
         self._config.update(new_values)
-        self._save()
+        self._commit()
 
     def delete(self, key: str) -> None:
         """Delete a configuration value"""
+        self._refresh()
         if key in self._config:
             del self._config[key]
             _LOGGER.info("Deleting configuration: %s", key)
-            self._save()
+            self._commit()
         else:
             _LOGGER.warning("Key %s not found in configuration", key)
 
@@ -53,9 +113,71 @@ class Config:
         """Reset the configuration"""
         _LOGGER.info("Resetting configuration")
         self._config = {}
-        self._save()
+        self._commit()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Apply several configuration changes with a single write to disk
+
+        Changes made inside the block are rolled back when an exception is raised.
+        """
+        self._refresh()
+        snapshot, was_dirty = dict(self._config), self._dirty
+        self._batch_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._config, self._dirty = snapshot, was_dirty
+            raise
+        finally:
+            self._batch_depth -= 1
+
+        if self._batch_depth == 0:
+            # A transaction is an explicit commit point, persist it right away
+            self.flush()
+
+    def _commit(self) -> None:
+        """Persist the changes, coalescing bursts of writes on the event loop"""
+        self._dirty = True
+        if self._batch_depth:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        """Write pending changes to disk, if any"""
+        self._flush_scheduled = False
+        if self._dirty:
+            self._save()
 
     def _save(self) -> None:
-        """Save the current configuration to the JSON file"""
-        with open(self.path, "w", encoding="utf-8") as f:
+        """Atomically save the current configuration to the JSON file"""
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(self._config, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._disk_writes += 1
+        # Our own write is already reflected in memory, no need to read it back
+        self._signature = self._stat_signature()
+
+
+_SHARED_CONFIG: Config | None = None
+
+
+def get_config() -> Config:
+    """Get the process-wide shared configuration"""
+    global _SHARED_CONFIG  # pylint: disable=global-statement
+    if _SHARED_CONFIG is None:
+        _SHARED_CONFIG = Config()
+    return _SHARED_CONFIG
@@ -19,3 +19,7 @@ class TrueLayer2FireflyTimeoutError(TrueLayer2FireflyError):
 
 class TrueLayer2FireflyBadRequestError(TrueLayer2FireflyError):
     """Exception raised for bad request errors."""
+
+
+class TrueLayer2FireflyDuplicateError(TrueLayer2FireflyBadRequestError):
+    """Exception raised when Firefly rejects a duplicate transaction."""
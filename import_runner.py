@@ -0,0 +1,455 @@
+"""Serialize the import runs of the scheduler and the web interface.
+
+Only one import runs at a time. What happens with an import requested while
+another one runs depends on the `import_overlap_policy` setting:
+
+- `skip`: the requested import is not run.
+- `queue`: the requested import runs once the running one is done.
+- `coalesce`: like `queue`, but at most one import waits. Imports requested
+  while one is waiting are skipped, the waiting import picks up their
+  transactions anyway.
+
+The events of the running import are broadcast, so the web interface follows
+the running import instead of starting another one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from functools import partial
+import logging
+import time
+from typing import Any
+import uuid
+
+from clients.firefly import FireflyClient
+from clients.http_client import ConnectionStats
+from clients.truelayer import TrueLayerClient
+from config import Config, get_config
+from exceptions import TrueLayer2FireflyError
+from importer2firefly import Import2Firefly
+from run_history import RunHistory, percentiles
+
+_LOGGER = logging.getLogger(__name__)
+
+OVERLAP_POLICIES = ("skip", "queue", "coalesce")
+DEFAULT_OVERLAP_POLICY = "skip"
+DEFAULT_REPLAY_SIZE = 1000
+DEFAULT_JOB_HISTORY = 20
+DEFAULT_SHUTDOWN_TIMEOUT = 30
+
+_END = object()
+
+
+@dataclass
+class ImportRun:
+    """Duration, throughput and outcome of an import run."""
+
+    trigger: str
+    started_at: datetime
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    finished_at: datetime | None = None
+    duration: float = 0.0
+    transactions: int = 0
+    failed: int = 0
+    outcome: str = "queued"
+    error: str | None = None
+    accounts: list[dict[str, Any]] = field(default_factory=list)
+    upstream: dict[str, dict[str, Any]] = field(default_factory=dict)
+    config_reads: int = 0
+    config_writes: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Get the number of transactions handled per second."""
+        return self.transactions / self.duration if self.duration else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the run as a dictionary."""
+        return {
+            "id": self.id,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration": round(self.duration, 3),
+            "transactions": self.transactions,
+            "failed": self.failed,
+            "throughput": round(self.throughput, 1),
+            "outcome": self.outcome,
+            "error": self.error,
+            "accounts": self.accounts,
+            "upstream": self.upstream,
+            "config": {
+                "disk_reads": self.config_reads,
+                "disk_writes": self.config_writes,
+            },
+        }
+
+
+class ImportBroadcast:
+    """Send the events of an import to every subscriber.
+
+    The latest `replay_size` events are kept, so a subscriber joining halfway
+    through the import first receives what it missed.
+    """
+
+    def __init__(self, replay_size: int = DEFAULT_REPLAY_SIZE) -> None:
+        """Initialize the broadcast of an import."""
+        self._replay: deque[Any] = deque(maxlen=max(replay_size, 0))
+        self._subscribers: set[asyncio.Queue[Any]] = set()
+        self.done = False
+        self.error: Exception | None = None
+        self.published = 0
+
+    @property
+    def subscribers(self) -> int:
+        """Get the number of subscribers following the import."""
+        return len(self._subscribers)
+
+    def publish(self, event: Any) -> None:
+        """Send an event to all subscribers."""
+        self._replay.append(event)
+        self.published += 1
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def close(self, error: Exception | None = None) -> None:
+        """End the broadcast, with the error the import failed with."""
+        self.done = True
+        self.error = error
+        for queue in self._subscribers:
+            queue.put_nowait(_END)
+
+    async def subscribe(self) -> AsyncGenerator[Any, None]:
+        """Generate the buffered events, then the events still to come.
+
+        The error of a failed import is raised once all events are generated.
+        """
+        queue: asyncio.Queue[Any] = asyncio.Queue()
+        replay = list(self._replay)
+        following = not self.done
+        if following:
+            self._subscribers.add(queue)
+        try:
+            for event in replay:
+                yield event
+            if following:
+                while (event := await queue.get()) is not _END:
+                    yield event
+            if self.error is not None:
+                raise self.error
+        finally:
+            self._subscribers.discard(queue)
+
+
+@dataclass
+class ImportJob:
+    """An import run in the background, with the broadcast of its events."""
+
+    run: ImportRun
+    broadcast: ImportBroadcast
+    task: asyncio.Task[ImportRun] | None = None
+
+    @property
+    def id(self) -> str:
+        """Get the id of the job, which is the id of its run."""
+        return self.run.id
+
+    @property
+    def done(self) -> bool:
+        """Check if the import is done, or never ran."""
+        return self.broadcast.done
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the status and statistics of the job."""
+        return {
+            **self.run.as_dict(),
+            "events": self.broadcast.published,
+            "subscribers": self.broadcast.subscribers,
+        }
+
+
+class ImportRunner:
+    """Run imports one at a time, as jobs in the background."""
+
+    def __init__(
+        self,
+        truelayer_client: TrueLayerClient | None = None,
+        firefly_client: FireflyClient | None = None,
+        config: Config | None = None,
+    ) -> None:
+        """Initialize the runner with the clients shared by all imports."""
+        self._config: Config = config or get_config()
+        self._truelayer_client = truelayer_client
+        self._firefly_client = firefly_client
+        self.jobs: dict[str, ImportJob] = {}
+        # The job running, or about to run, and the jobs waiting for it in order
+        self.active: ImportJob | None = None
+        self._queued: deque[tuple[ImportJob, asyncio.Future[None]]] = deque()
+        self.last_run: ImportRun | None = None
+        self._tasks: set[asyncio.Task[ImportRun]] = set()
+        self.history: RunHistory | None = None
+        if self._config.get("import_run_history", True):
+            self.history = RunHistory.from_config(self._config)
+
+    @property
+    def running(self) -> bool:
+        """Check if an import is running."""
+        return self.active is not None
+
+    @property
+    def policy(self) -> str:
+        """Get what to do with an import requested while another one runs."""
+        policy = self._config.get("import_overlap_policy", DEFAULT_OVERLAP_POLICY)
+        if policy not in OVERLAP_POLICIES:
+            _LOGGER.warning(
+                "Unknown import overlap policy %s, using %s",
+                policy,
+                DEFAULT_OVERLAP_POLICY,
+            )
+            return DEFAULT_OVERLAP_POLICY
+        return policy
+
+    def _create_importer(self) -> Import2Firefly:
+        """Create the importer of a run."""
+        return Import2Firefly(
+            truelayer_client=self._truelayer_client,
+            firefly_client=self._firefly_client,
+            config=self._config,
+        )
+
+    def _connection_stats(self) -> dict[str, ConnectionStats]:
+        """Get the connection statistics of the clients, by API."""
+        return {
+            name: client.connection_stats
+            for name, client in (
+                ("truelayer", self._truelayer_client),
+                ("firefly", self._firefly_client),
+            )
+            if isinstance(getattr(client, "connection_stats", None), ConnectionStats)
+        }
+
+    def _finish(self, run: ImportRun) -> None:
+        """Log the outcome of a run, keep it as the last run and store it."""
+        run.finished_at = datetime.now(UTC)
+        _LOGGER.info(
+            "Import run (%s) %s in %.1f s, %s transaction(s) at %.1f per second, "
+            "%s failure(s), %s config read(s) and %s write(s)",
+            run.trigger,
+            run.outcome,
+            run.duration,
+            run.transactions,
+            run.throughput,
+            run.failed,
+            run.config_reads,
+            run.config_writes,
+        )
+        self.last_run = run
+        if self.history is not None:
+            self.history.record(run.as_dict())
+
+    def _create_job(self, trigger: str) -> ImportJob:
+        """Create a job, forgetting the oldest finished jobs."""
+        job = ImportJob(
+            ImportRun(trigger, datetime.now(UTC)),
+            ImportBroadcast(
+                int(self._config.get("import_stream_replay_size", DEFAULT_REPLAY_SIZE))
+            ),
+        )
+        self.jobs[job.id] = job
+
+        history = int(self._config.get("import_job_history", DEFAULT_JOB_HISTORY))
+        finished = [old for old in self.jobs.values() if old.done]
+        for old in finished[: max(len(finished) - history, 0)]:
+            del self.jobs[old.id]
+        return job
+
+    def _claim(self, job: ImportJob) -> None:
+        """Make a job the active job right away, when no import runs."""
+        if self.active is None:
+            self.active = job
+
+    async def _wait_turn(self, job: ImportJob) -> None:
+        """Wait until the running imports are done and the job is active."""
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._queued.append((job, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if self.active is job:
+                # Cancelled right after its turn came, hand it on
+                self._release()
+            else:
+                self._queued.remove((job, future))
+            raise
+
+    def _release(self) -> None:
+        """End the active job, handing its turn to the next waiting job."""
+        self.active = None
+        while self._queued:
+            job, future = self._queued.popleft()
+            if not future.done():
+                self.active = job
+                future.set_result(None)
+                return
+
+    async def _run(
+        self, job: ImportJob, backfill_months: int | None
+    ) -> AsyncGenerator[Any, None]:
+        """Run the import of a job, recording and broadcasting it.
+
+        A job claimed while no import runs starts right away, the others follow
+        the overlap policy.
+        """
+        run, broadcast = job.run, job.broadcast
+        policy = self.policy
+        self._claim(job)
+        if self.active is not job and (
+            policy == "skip" or (policy == "coalesce" and self._queued)
+        ):
+            run.outcome = "skipped"
+            self._finish(run)
+            broadcast.publish("Import skipped, another import is already running")
+            broadcast.close()
+            yield "Import skipped, another import is already running"
+            return
+
+        if self.active is not job:
+            yield "Another import is running, waiting for it to finish"
+            await self._wait_turn(job)
+
+        run.started_at = datetime.now(UTC)
+        run.outcome = "running"
+        importer = self._create_importer()
+        connection_stats = self._connection_stats()
+        marks = {
+            name: (stats.requests, stats.responses)
+            for name, stats in connection_stats.items()
+        }
+        config_reads, config_writes = self._config.disk_reads, self._config.disk_writes
+        started = time.monotonic()
+        error: Exception | None = None
+        try:
+            async for event in importer.start_import(backfill_months=backfill_months):
+                broadcast.publish(event)
+                yield event
+        except Exception as err:
+            run.outcome, run.error = "failed", str(err)
+            error = err
+            raise
+        except BaseException:
+            # Cancelled, or the consumer stopped listening
+            run.outcome = "cancelled"
+            error = TrueLayer2FireflyError("The import was cancelled")
+            raise
+        else:
+            run.outcome = "partial" if importer.transactions_failed else "succeeded"
+        finally:
+            run.duration = time.monotonic() - started
+            run.transactions = importer.transactions_processed
+            run.failed = importer.transactions_failed
+            run.accounts = importer.account_stats
+            # Write the coalesced changes of the run, so they are counted with it
+            self._config.flush()
+            run.config_reads = self._config.disk_reads - config_reads
+            run.config_writes = self._config.disk_writes - config_writes
+            run.upstream = {
+                name: {
+                    "calls": stats.requests - marks[name][0],
+                    **percentiles(stats.latencies_since(marks[name][1])),
+                }
+                for name, stats in connection_stats.items()
+            }
+            broadcast.close(error)
+            self._finish(run)
+            self._release()
+
+    async def _complete(self, job: ImportJob, backfill_months: int | None) -> ImportRun:
+        """Run the import of a job to the end, logging its events."""
+        try:
+            async for event in self._run(job, backfill_months):
+                _LOGGER.info("Import event: %s", event)
+        except Exception as err:
+            _LOGGER.error("Error during import: %s", err)
+        return job.run
+
+    def _spawn(self, job: ImportJob, backfill_months: int | None) -> ImportJob:
+        """Run the import of a job in the background.
+
+        The job is claimed right away when no import runs, so an import
+        requested in the same tick can't take its turn.
+        """
+        self._claim(job)
+        job.task = asyncio.create_task(self._complete(job, backfill_months))
+        self._tasks.add(job.task)
+        job.task.add_done_callback(partial(self._forget_task, job))
+        return job
+
+    def _forget_task(self, job: ImportJob, task: asyncio.Task[ImportRun]) -> None:
+        """Forget a finished task, releasing its job when it never got to run."""
+        self._tasks.discard(task)
+        if self.active is job:
+            self._release()
+
+    async def run_to_completion(
+        self, trigger: str, backfill_months: int | None = None
+    ) -> ImportRun:
+        """Run an import, logging its events, and get the recorded run.
+
+        The import runs as a job, so it is waited for on shutdown.
+        """
+        job = self._spawn(self._create_job(trigger), backfill_months)
+        return await asyncio.shield(job.task)
+
+    def start(self, trigger: str, backfill_months: int | None = None) -> ImportJob:
+        """Start an import in the background, unless one is running already.
+
+        The job of the running import is returned, so every caller follows the
+        same import.
+        """
+        if self.active is not None:
+            return self.active
+        return self._spawn(self._create_job(trigger), backfill_months)
+
+    async def follow(
+        self, trigger: str, backfill_months: int | None = None
+    ) -> AsyncGenerator[Any, None]:
+        """Follow the running import, or start one, and generate its events."""
+        if self.active is not None and backfill_months is not None:
+            yield (
+                "An import is already running, following it without the "
+                f"requested backfill of {backfill_months} month(s)"
+            )
+        elif self.active is not None:
+            yield "An import is already running, following it"
+        async for event in self.start(trigger, backfill_months).broadcast.subscribe():
+            yield event
+
+    async def shutdown(self) -> None:
+        """Wait for the running imports, cancelling them after the timeout."""
+        if not self._tasks:
+            return
+
+        timeout = float(
+            self._config.get("import_shutdown_timeout", DEFAULT_SHUTDOWN_TIMEOUT)
+        )
+        _LOGGER.info(
+            "Waiting up to %s seconds for %s import(s) to finish",
+            timeout,
+            len(self._tasks),
+        )
+        _done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            _LOGGER.warning("Cancelled %s unfinished import(s)", len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def close(self) -> None:
+        """Close the run history."""
+        if self.history is not None:
+            self.history.close()
@@ -2,69 +2,1220 @@
 
 from __future__ import annotations
 import asyncio
-from collections.abc import AsyncGenerator
-from datetime import datetime
+from collections import deque
+from collections.abc import AsyncGenerator, Awaitable, Callable, Coroutine
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
 import logging
+import time
 from typing import Any
 
 
+from account_cache import AccountCache
+from account_index import AccountIndex, normalize_iban
 from clients.firefly import FireflyClient
 from clients.truelayer import TrueLayerClient
-from config import Config
+from config import Config, get_config
+from exceptions import (
+    TrueLayer2FireflyBadRequestError,
+    TrueLayer2FireflyDuplicateError,
+    TrueLayer2FireflyError,
+)
+from ledger import ImportLedger, index_journals, transaction_fingerprint
 
 _LOGGER = logging.getLogger(__name__)
 
+SYNC_CURSORS_KEY = "truelayer_sync_cursors"
+DEFAULT_SYNC_OVERLAP_HOURS = 72
+BACKFILL_WINDOWS_KEY = "truelayer_backfill_windows"
+DEFAULT_BACKFILL_CONCURRENCY = 3
+# The account types the import matches against, other types are never fetched
+IMPORT_ACCOUNT_TYPES = ("asset", "expense", "revenue")
+# Account type of the counterparty, per Firefly transaction type
+COUNTERPARTY_TYPES = {"withdrawal": "expense", "deposit": "revenue"}
+ACCOUNT_CACHE_FILE = "firefly_accounts.sqlite"
+DEFAULT_ACCOUNT_CACHE_MAX_AGE_HOURS = 24
+# Transactions posted to Firefly at the same time, 1 posts them one by one in order
+DEFAULT_POST_CONCURRENCY = 1
+DEFAULT_ACCOUNT_CONCURRENCY = 4
+# The stages of an import, each stage works on its own batch at the same time
+PIPELINE_STAGES = ("accounts", "fetch", "match", "map", "post")
+# Batches waiting in between two stages, before the earlier stage has to wait
+DEFAULT_PIPELINE_QUEUE_SIZE = 2
+# Accounts fetched from TrueLayer ahead of the account being imported
+DEFAULT_FETCH_CONCURRENCY = 2
+DEFAULT_FETCH_MAX_TRANSACTIONS = 5000
+
+_DONE = object()
+_NO_TRANSACTIONS = object()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse a TrueLayer timestamp, assuming UTC when no offset is given."""
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=UTC)
+    return timestamp
+
+
+def month_windows(months: int, now: datetime) -> list[tuple[datetime, datetime]]:
+    """Split the last months into calendar month windows, oldest first."""
+    year, month = now.year, now.month
+    starts: list[datetime] = []
+    for _ in range(months):
+        starts.append(datetime(year, month, 1, tzinfo=now.tzinfo))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    starts.reverse()
+
+    ends = [start - timedelta(seconds=1) for start in starts[1:]] + [now]
+    return list(zip(starts, ends))
+
+
+@dataclass
+class _AccountRun:
+    """Counters and synchronization bounds of the import of a single account."""
+
+    total: int = 0
+    processed: int = 0
+    matching: int = 0
+    unmatching: int = 0
+    newly_created: int = 0
+    skipped: int = 0
+    existing: int = 0
+    created: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    latest_synced: datetime | None = None
+    earliest_failed: datetime | None = None
+
+    def succeed(self, timestamp: datetime) -> None:
+        """Record a transaction which is stored in Firefly."""
+        self.latest_synced = max(self.latest_synced or timestamp, timestamp)
+
+    def fail(self, timestamp: datetime) -> None:
+        """Record a transaction, or window of transactions, which failed."""
+        self.failed += 1
+        self.earliest_failed = min(self.earliest_failed or timestamp, timestamp)
+
+    def progress(self, account: str) -> dict[str, Any]:
+        """Get the progress event of the account."""
+        return {
+            "type": "progress",
+            "data": {
+                "account": account,
+                "current": self.processed,
+                "total": self.total,
+            },
+        }
+
+
+@dataclass
+class _AccountJob:
+    """A TrueLayer account with the Firefly asset account it is imported into."""
+
+    account_id: str
+    iban: str
+    import_account: dict[str, Any]
+    months: int | None
+    sync_from: datetime | None
+    state: _AccountRun = field(default_factory=_AccountRun)
+    # End of the last backfill window, the cursor when nothing was posted
+    backfill_until: datetime | None = None
+
+
+@dataclass
+class _Batch:
+    """A chunk of transactions of an account, moving through the pipeline.
+
+    A batch without a chunk marks the end of the transactions of the account.
+    """
+
+    job: _AccountJob
+    chunk: dict[str, Any] | None = None
+    linked: list[tuple[dict[str, Any], dict[str, Any] | None]] = field(
+        default_factory=list
+    )
+    # Created counterparties by key, None when the creation failed
+    created: dict[tuple[str, str | None], dict[str, Any] | None] = field(
+        default_factory=dict
+    )
+    payloads: list[tuple[datetime, dict[str, Any] | None]] = field(default_factory=list)
+
+
+@dataclass
+class _StageEnd:
+    """Event telling a pipeline stage finished, or failed with an error."""
+
+    error: Exception | None = None
+
+
+@dataclass
+class StageStats:
+    """Latency and queue depth of a stage of the import pipeline."""
+
+    items: int = 0
+    busy: float = 0.0
+    max_latency: float = 0.0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+    def record(self, latency: float) -> None:
+        """Record the time it took to handle an item."""
+        self.items += 1
+        self.busy += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def observe_queue(self, depth: int) -> None:
+        """Record the number of items waiting for the stage."""
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    @property
+    def average_latency(self) -> float:
+        """Get the average time it took to handle an item."""
+        return self.busy / self.items if self.items else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the statistics as a dictionary, with latencies in milliseconds."""
+        return {
+            "items": self.items,
+            "average_latency_ms": round(self.average_latency * 1000, 1),
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+def _journal_id(created: dict[str, Any]) -> str | None:
+    """Get the journal id from the response to a created transaction."""
+    splits = created.get("data", {}).get("attributes", {}).get("transactions", [])
+    if not splits or splits[0].get("transaction_journal_id") is None:
+        return None
+    return str(splits[0]["transaction_journal_id"])
+
+
+def _counterparty(txn: dict[str, Any]) -> tuple[str, str, str | None] | None:
+    """Get the account type, IBAN and name of the counterparty of a transaction."""
+    cp_iban = txn.get("meta", {}).get("counter_party_iban")
+    if cp_iban is None:
+        return None
+    account_type = (
+        "expense" if txn["transaction_type"].lower() == "debit" else "revenue"
+    )
+    return (
+        account_type,
+        cp_iban,
+        txn.get("meta", {}).get("counter_party_preferred_name"),
+    )
+
+
+def _counterparty_key(attributes: dict[str, Any]) -> tuple[str, str | None]:
+    """Get the type and normalized IBAN identifying a counterparty to create."""
+    return attributes["type"], normalize_iban(attributes["iban"])
+
+
+def _import_transaction(
+    txn: dict[str, Any],
+    import_account: dict[str, Any],
+    linked_account: dict[str, Any] | None,
+) -> dict[str, Any]:
+    """Map a TrueLayer transaction to a Firefly transaction."""
+    transaction_type = (
+        "debit" if txn["transaction_type"].lower() == "debit" else "credit"
+    )
+
+    # Ensure the amount is always positive
+    amount = abs(txn["amount"])
+    return {
+        "error_if_duplicate_hash": True,
+        "apply_rules": True,
+        "fire_webhooks": True,
+        "transactions": [
+            {
+                "description": txn["description"],
+                "date": txn["timestamp"],
+                "amount": amount,
+                "type": ("deposit" if transaction_type == "credit" else "withdrawal"),
+                # SWAP for deposit: asset account is destination, revenue account is source
+                "destination_id": (
+                    import_account["id"]
+                    if transaction_type == "credit"
+                    else (None if linked_account is None else linked_account["id"])
+                ),
+                "destination_name": (
+                    import_account["attributes"]["name"]
+                    if transaction_type == "credit"
+                    else (
+                        "(unknown expense account)"
+                        if linked_account is None
+                        else linked_account["attributes"]["name"]
+                    )
+                ),
+                "source_id": (
+                    (None if linked_account is None else linked_account["id"])
+                    if transaction_type == "credit"
+                    else import_account["id"]
+                ),
+                "source_name": (
+                    (
+                        "(unknown revenue account)"
+                        if linked_account is None
+                        else linked_account["attributes"]["name"]
+                    )
+                    if transaction_type == "credit"
+                    else import_account["attributes"]["name"]
+                ),
+                "account_id": import_account["id"],
+                "linked_account_id": txn["transaction_id"],
+            }
+        ],
+    }
+
+
+async def _single_chunk(
+    transactions: list[dict[str, Any]],
+) -> AsyncGenerator[dict[str, Any], None]:
+    """Wrap a regular transaction fetch as a single chunk."""
+    yield {
+        "index": 1,
+        "total": 1,
+        "from": None,
+        "to": None,
+        "transactions": transactions,
+        "error": None,
+    }
+
 
 class Import2Firefly:
     """Class to handle the import workflow."""
 
-    def __init__(self) -> None:
-        """Initialize the Import class."""
-        self._config: Config = Config()
-        self._truelayer_client: TrueLayerClient = TrueLayerClient()
-        self._firefly_client: FireflyClient = FireflyClient()
+    def __init__(
+        self,
+        truelayer_client: TrueLayerClient | None = None,
+        firefly_client: FireflyClient | None = None,
+        config: Config | None = None,
+    ) -> None:
+        """Initialize the Import class.
+
+        The clients are expected to be the long-lived instances owned by the
+        application, so their connection pools are reused across import runs.
+        """
+        self._config: Config = config or get_config()
+        self._truelayer_client: TrueLayerClient = truelayer_client or TrueLayerClient(
+            config=self._config
+        )
+        self._firefly_client: FireflyClient = firefly_client or FireflyClient(
+            config=self._config
+        )
 
         self.start_time = datetime.now()
         self.end_time = None
+        self.accounts_created = 0
+        self.account_reconciliations = 0
+        self.account_cache_hits = 0
+        self._post_concurrency: int = max(
+            int(self._config.get("import_post_concurrency", DEFAULT_POST_CONCURRENCY)),
+            1,
+        )
+
+        self._account_cache: AccountCache | None = None
+        if self._config.get("firefly_account_cache", True):
+            self._account_cache = AccountCache(
+                self._config.path.parent / ACCOUNT_CACHE_FILE,
+                source=self._config.get("firefly_api_url"),
+            )
+
+        self._account_semaphore = asyncio.Semaphore(
+            max(
+                int(
+                    self._config.get(
+                        "import_account_concurrency", DEFAULT_ACCOUNT_CONCURRENCY
+                    )
+                ),
+                1,
+            )
+        )
+        self._counterparty_tasks: dict[
+            tuple[str, str | None],
+            asyncio.Task[tuple[dict[str, Any] | None, str | None]],
+        ] = {}
+        self._prefetch_existing: bool = bool(
+            self._config.get("import_prefetch_existing", False)
+        )
+        self._ledger: ImportLedger | None = None
+        if self._config.get("import_ledger", True):
+            self._ledger = ImportLedger.from_config(self._config)
+
+        self.pipeline_stats: dict[str, StageStats] = {
+            name: StageStats() for name in PIPELINE_STAGES
+        }
+        self._firefly_accounts = AccountIndex()
+        self._reconcile_every = 0
+        self._events: asyncio.Queue[Any] = asyncio.Queue()
+        self._queues: dict[str, asyncio.Queue[Any]] = {}
+        self.fetch_latencies: dict[str, float] = {}
+        self._jobs: list[_AccountJob] = []
+
+    def _sync_window_start(self, account_id: str) -> datetime | None:
+        """Get the start of the incremental sync window for an account.
+
+        The stored high-water mark is moved back by a safety overlap, since
+        pending transactions can settle with an earlier timestamp.
+        """
+        cursor = self._config.get(SYNC_CURSORS_KEY, {}).get(account_id)
+        if not cursor:
+            return None
+
+        overlap = timedelta(
+            hours=self._config.get(
+                "import_sync_overlap_hours", DEFAULT_SYNC_OVERLAP_HOURS
+            )
+        )
+        return parse_timestamp(cursor) - overlap
+
+    def _store_sync_cursor(
+        self,
+        account_id: str,
+        latest_synced: datetime | None,
+        earliest_failed: datetime | None,
+    ) -> None:
+        """Store the high-water mark of an account after an import."""
+        cursor = latest_synced
+        if earliest_failed is not None:
+            # Make sure failed transactions are fetched again on the next run
+            cursor = earliest_failed - timedelta(seconds=1)
+        if cursor is None:
+            return
 
-    async def start_import(self) -> AsyncGenerator[Any, Any]:
-        """Start the import process."""
+        cursors = dict(self._config.get(SYNC_CURSORS_KEY, {}))
+        cursors[account_id] = cursor.isoformat()
+        self._config.set(SYNC_CURSORS_KEY, cursors)
 
-        yield "TrueLayer: Fetching accounts from TrueLayer"
-        response = await self._truelayer_client.get_accounts()
-        await asyncio.sleep(0)
+    async def _fetch_backfill_windows(
+        self,
+        account_id: str,
+        windows: list[tuple[datetime, datetime]],
+    ) -> AsyncGenerator[dict[str, Any], None]:
+        """Fetch the backfill windows of an account with bounded concurrency.
+
+        Windows are yielded oldest first with their transactions sorted by
+        timestamp. Only a limited number of windows is fetched ahead of the
+        consumer, which keeps the memory usage bounded on long histories.
+        """
+        concurrency = max(
+            int(
+                self._config.get(
+                    "import_backfill_concurrency", DEFAULT_BACKFILL_CONCURRENCY
+                )
+            ),
+            1,
+        )
+
+        async def fetch(window_from: datetime, window_to: datetime) -> Any:
+            return await self._truelayer_client.get_transactions(
+                account_id, from_date=window_from, to_date=window_to
+            )
+
+        upcoming = iter(enumerate(windows, start=1))
+        pending: deque[tuple[int, tuple[datetime, datetime], asyncio.Task]] = deque()
+
+        def schedule() -> None:
+            while len(pending) < concurrency:
+                try:
+                    index, window = next(upcoming)
+                except StopIteration:
+                    return
+                pending.append((index, window, asyncio.create_task(fetch(*window))))
+
+        try:
+            schedule()
+            while pending:
+                index, (window_from, window_to), task = pending.popleft()
+                chunk: dict[str, Any] = {
+                    "index": index,
+                    "total": len(windows),
+                    "from": window_from,
+                    "to": window_to,
+                    "transactions": [],
+                    "error": None,
+                }
+                try:
+                    response = await task
+                except TrueLayer2FireflyError as err:
+                    chunk["error"] = str(err)
+                else:
+                    chunk["transactions"] = sorted(
+                        response.json().get("results", []),
+                        key=lambda txn: parse_timestamp(txn["timestamp"]),
+                    )
+                schedule()
+                yield chunk
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    def _mark_backfill_window_done(
+        self, account_id: str, window_from: datetime
+    ) -> None:
+        """Remember a completed backfill window, so an aborted backfill can resume."""
+        progress = dict(self._config.get(BACKFILL_WINDOWS_KEY, {}))
+        progress[account_id] = [*progress.get(account_id, []), window_from.isoformat()]
+        self._config.set(BACKFILL_WINDOWS_KEY, progress)
+
+    def _clear_backfill_progress(self, account_id: str) -> None:
+        """Forget the backfill progress of an account once it is complete."""
+        progress = dict(self._config.get(BACKFILL_WINDOWS_KEY, {}))
+        if progress.pop(account_id, None) is not None:
+            self._config.set(BACKFILL_WINDOWS_KEY, progress)
+
+    @property
+    def account_refreshes_avoided(self) -> int:
+        """Get the number of full account fetches saved by updating the index."""
+        return self.accounts_created - self.account_reconciliations
+
+    @property
+    def transactions_processed(self) -> int:
+        """Get the number of transactions handled so far, in all accounts."""
+        return sum(job.state.processed for job in self._jobs)
+
+    @property
+    def transactions_failed(self) -> int:
+        """Get the number of transactions and windows which failed so far."""
+        return sum(job.state.failed for job in self._jobs)
+
+    @property
+    def account_stats(self) -> list[dict[str, Any]]:
+        """Get the counters of every imported account."""
+        return [
+            {
+                "account": job.iban,
+                "fetched": job.state.total,
+                "created": job.state.created,
+                "duplicates": job.state.duplicates,
+                "skipped": job.state.skipped + job.state.existing,
+                "failed": job.state.failed,
+                "accounts_created": job.state.newly_created,
+                "fetch_latency_ms": (
+                    round(self.fetch_latencies[job.iban] * 1000, 1)
+                    if job.iban in self.fetch_latencies
+                    else None
+                ),
+            }
+            for job in self._jobs
+        ]
+
+    async def _fetch_accounts_of_type(
+        self, account_type: str, refresh: bool
+    ) -> list[dict[str, Any]]:
+        """Get the Firefly accounts of a type, from the cache when it is current.
+
+        The cache is current when Firefly still reports the same number of
+        accounts and it is younger than the maximum age. Accounts renamed in
+        Firefly are picked up when the cache expires, or once Firefly rejected
+        an account of the type.
+        """
+        cache = self._account_cache
+        if cache is not None and not refresh:
+            cached = cache.load(account_type)
+            max_age = timedelta(
+                hours=self._config.get(
+                    "firefly_account_cache_max_age_hours",
+                    DEFAULT_ACCOUNT_CACHE_MAX_AGE_HOURS,
+                )
+            ).total_seconds()
+            if cached is not None and time.time() - cached[2] < max_age:
+                accounts, total, _synced_at = cached
+                current = await self._firefly_client.get_account_count(account_type)
+                if current == total:
+                    self.account_cache_hits += 1
+                    return accounts
+                _LOGGER.info(
+                    "Firefly reports %s %s account(s) instead of %s, refreshing the cache",
+                    current,
+                    account_type,
+                    total,
+                )
+
+        accounts = await self._firefly_client.get_account_paginated(
+            account_type=account_type
+        )
+        if cache is not None:
+            cache.replace(account_type, accounts)
+        return accounts
+
+    async def _fetch_firefly_accounts(
+        self, refresh: bool = False
+    ) -> list[dict[str, Any]]:
+        """Fetch the Firefly accounts of the types used by the import."""
+        accounts_per_type = await asyncio.gather(
+            *(
+                self._fetch_accounts_of_type(account_type, refresh)
+                for account_type in IMPORT_ACCOUNT_TYPES
+            )
+        )
+        return [account for accounts in accounts_per_type for account in accounts]
+
+    async def _reconcile_accounts(self, index: AccountIndex) -> AccountIndex:
+        """Rebuild the account index from Firefly and log any drift."""
+        reconciled = AccountIndex(await self._fetch_firefly_accounts(refresh=True))
+        self.account_reconciliations += 1
+
+        known = {account["id"] for account in index.accounts}
+        current = {account["id"] for account in reconciled.accounts}
+        if known != current:
+            _LOGGER.warning(
+                "Firefly accounts drifted during the import: %s added, %s removed",
+                len(current - known),
+                len(known - current),
+            )
+        return reconciled
+
+    async def _post_transaction(
+        self, import_transaction: dict[str, Any]
+    ) -> tuple[str, str]:
+        """Post a transaction to Firefly, returning the outcome and a message."""
+        transaction = import_transaction["transactions"][0]
+        summary = f"{transaction['description']} - {transaction['amount']} - {transaction['date']}"
+        try:
+            response = await self._firefly_client.create_transaction(import_transaction)
+        except TrueLayer2FireflyDuplicateError:
+            self._record_in_ledger(transaction, None)
+            return "duplicate", f"Transaction already exists: {summary}"
+        except TrueLayer2FireflyBadRequestError as e:
+            # An account of the transaction may be gone or changed in Firefly
+            self._invalidate_cached_accounts(
+                "asset", COUNTERPARTY_TYPES.get(transaction["type"])
+            )
+            return "failed", f"Error creating transaction in Firefly: {e}"
+        except Exception as e:
+            return "failed", f"Error creating transaction in Firefly: {e}"
+
+        if response.status_code == 200:
+            self._record_in_ledger(transaction, _journal_id(response.json()))
+            return "created", f"Transaction created: {summary}"
+        return "failed", f"Error creating transaction in Firefly: {response.text}"
+
+    async def _existing_journals(
+        self, firefly_account_id: str, txns: list[dict[str, Any]]
+    ) -> dict[tuple[str, str, str], list[str]]:
+        """Get the journals already in Firefly around the dates of the transactions.
+
+        When Firefly can't be asked, nothing is skipped and its duplicate
+        detection still prevents transactions from being stored twice.
+        """
+        # A day of margin on both sides, Firefly filters on its own timezone
+        dates = [parse_timestamp(txn["timestamp"]).date() for txn in txns]
+        try:
+            groups = await self._firefly_client.get_account_transactions(
+                firefly_account_id,
+                start=min(dates) - timedelta(days=1),
+                end=max(dates) + timedelta(days=1),
+            )
+        except TrueLayer2FireflyError as err:
+            _LOGGER.warning(
+                "Unable to fetch the existing Firefly transactions: %s", err
+            )
+            return {}
+        return index_journals(groups)
+
+    async def _create_counterparty(
+        self, attributes: dict[str, Any]
+    ) -> tuple[dict[str, Any] | None, str | None]:
+        """Create a counterparty account, returning the account or an error.
+
+        Creations are single-flight per type and IBAN, concurrent callers for the
+        same counterparty share a single request. A failed creation is forgotten,
+        so a later caller can try again.
+        """
+        key = _counterparty_key(attributes)
+        task = self._counterparty_tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(self._do_create_counterparty(attributes))
+            self._counterparty_tasks[key] = task
+
+        account, error = await asyncio.shield(task)
+        if account is None and self._counterparty_tasks.get(key) is task:
+            del self._counterparty_tasks[key]
+        return account, error
+
+    async def _do_create_counterparty(
+        self, attributes: dict[str, Any]
+    ) -> tuple[dict[str, Any] | None, str | None]:
+        """Create a counterparty account in Firefly."""
+        async with self._account_semaphore:
+            try:
+                response = await self._firefly_client.create_account(
+                    {
+                        "name": attributes["name"],
+                        "iban": attributes["iban"],
+                        "type": attributes["type"],
+                    }
+                )
+            except TrueLayer2FireflyBadRequestError as err:
+                # Likely an account Firefly has, but the cache does not know
+                self._invalidate_cached_accounts(attributes["type"])
+                return None, str(err)
+            except TrueLayer2FireflyError as err:
+                return None, str(err)
 
         if response.status_code != 200:
-            yield f"Error fetching accounts from TrueLayer: {response.text}"
+            return None, response.text
+        return response.json()["data"], None
+
+    def _invalidate_cached_accounts(self, *account_types: str | None) -> None:
+        """Fetch the accounts of the types again on the next run."""
+        if self._account_cache is None:
             return
+        for account_type in account_types:
+            if account_type is not None:
+                _LOGGER.info(
+                    "Firefly rejected a %s account, refreshing the cache", account_type
+                )
+                self._account_cache.invalidate(account_type)
+
+    def _record_in_ledger(
+        self, transaction: dict[str, Any], journal_id: str | None
+    ) -> None:
+        """Remember a transaction stored in Firefly, to skip it on the next run."""
+        if self._ledger is not None:
+            self._ledger.record(
+                transaction["linked_account_id"], transaction["account_id"], journal_id
+            )
+
+    async def _settle_posts(
+        self,
+        in_flight: dict[asyncio.Task[tuple[str, str]], datetime],
+        state: _AccountRun,
+        account: str,
+        keep: int,
+    ) -> AsyncGenerator[Any, None]:
+        """Wait for posted transactions until at most `keep` are still in flight.
+
+        The outcome of every transaction is reported in the order they finish.
+        """
+        while len(in_flight) > keep:
+            done, _pending = await asyncio.wait(
+                in_flight, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                txn_timestamp = in_flight.pop(task)
+                outcome, message = task.result()
+                if outcome == "failed":
+                    state.fail(txn_timestamp)
+                else:
+                    state.succeed(txn_timestamp)
+                    if outcome == "created":
+                        state.created += 1
+                    else:
+                        state.duplicates += 1
+                state.processed += 1
+
+                yield message
+                yield state.progress(account)
+
+    def _emit(self, event: Any) -> None:
+        """Send an event of a pipeline stage to the consumer of the import."""
+        self._events.put_nowait(event)
+
+    def _pipeline_snapshot(self) -> dict[str, dict[str, Any]]:
+        """Get the statistics of all pipeline stages."""
+        for name, queue in self._queues.items():
+            self.pipeline_stats[name].queue_depth = queue.qsize()
+        return {name: stats.as_dict() for name, stats in self.pipeline_stats.items()}
+
+    async def _guard_stage(self, stage: Coroutine[Any, Any, None]) -> None:
+        """Run a pipeline stage, telling the consumer when it is done."""
+        try:
+            await stage
+        except Exception as err:
+            self._emit(_StageEnd(err))
+        else:
+            self._emit(_StageEnd())
+
+    async def _run_stage(
+        self,
+        name: str,
+        handler: Callable[[_Batch], Awaitable[_Batch]],
+        inbox: asyncio.Queue[Any],
+        outbox: asyncio.Queue[Any] | None,
+    ) -> None:
+        """Pass every batch in the inbox through the handler of a stage."""
+        stats = self.pipeline_stats[name]
+        while (batch := await inbox.get()) is not _DONE:
+            stats.observe_queue(inbox.qsize())
+            started = time.monotonic()
+            batch = await handler(batch)
+            stats.record(time.monotonic() - started)
+            if outbox is not None:
+                await outbox.put(batch)
+        if outbox is not None:
+            await outbox.put(_DONE)
+
+    async def _account_chunks(
+        self, job: _AccountJob
+    ) -> AsyncGenerator[dict[str, Any], None] | None:
+        """Start fetching the transactions of an account, None when that failed."""
+        if job.months:
+            windows = month_windows(job.months, datetime.now(UTC))
+            job.backfill_until = windows[-1][1]
+            completed = set(
+                self._config.get(BACKFILL_WINDOWS_KEY, {}).get(job.account_id, [])
+            )
+            pending_windows = [
+                window for window in windows if window[0].isoformat() not in completed
+            ]
+            self._emit(
+                f"TrueLayer: Backfilling {job.months} month(s) for {job.iban}, {len(pending_windows)} of {len(windows)} window(s) left"
+            )
+            return self._fetch_backfill_windows(job.account_id, pending_windows)
+
+        if job.sync_from is None:
+            self._emit(f"TrueLayer: Fetching transactions for {job.iban}...")
+        else:
+            self._emit(
+                f"TrueLayer: Fetching transactions for {job.iban} since {job.sync_from.isoformat()}..."
+            )
+        transactions = await self._truelayer_client.get_transactions(
+            job.account_id, from_date=job.sync_from
+        )
+
+        if transactions.status_code != 200:
+            self._emit(
+                f"Error fetching transactions from TrueLayer: {transactions.text}"
+            )
+            return None
+
+        parsed = transactions.json()
+        if "results" not in parsed:
+            self._emit("No transactions found in TrueLayer")
+            return None
+
+        self._emit(
+            f"TrueLayer: A total of {len(parsed['results'])} transaction(s) found"
+        )
+        return _single_chunk(parsed["results"])
+
+    async def _fetch_stage(
+        self, jobs: list[_AccountJob], outbox: asyncio.Queue[Any]
+    ) -> None:
+        """Fetch the transactions of the accounts, ahead of the other stages.
+
+        Up to `import_fetch_concurrency` accounts are fetched at the same time,
+        every account into its own buffer of chunks, which are handed on as soon
+        as they arrive. Accounts fetched ahead stop buffering while the buffered
+        transactions exceed `import_fetch_max_transactions`. The account being
+        handed on only waits for room in its buffer, so it can't stall.
+        """
+        stats = self.pipeline_stats["fetch"]
+        concurrency = max(
+            int(
+                self._config.get("import_fetch_concurrency", DEFAULT_FETCH_CONCURRENCY)
+            ),
+            1,
+        )
+        max_transactions = int(
+            self._config.get(
+                "import_fetch_max_transactions", DEFAULT_FETCH_MAX_TRANSACTIONS
+            )
+        )
+        buffer_size = max(
+            int(
+                self._config.get(
+                    "import_pipeline_queue_size", DEFAULT_PIPELINE_QUEUE_SIZE
+                )
+            ),
+            1,
+        )
+        upcoming = deque(jobs)
+        prefetching: deque[
+            tuple[_AccountJob, asyncio.Queue[Any], asyncio.Task[None]]
+        ] = deque()
+        room = asyncio.Condition()
+        held = 0
+        current: _AccountJob | None = None
+
+        async def prefetch(job: _AccountJob, buffer: asyncio.Queue[Any]) -> None:
+            """Fetch the transactions of an account into its buffer."""
+            nonlocal held
+            started = time.monotonic()
+            try:
+                chunks = await self._account_chunks(job)
+                if chunks is None:
+                    await buffer.put(_NO_TRANSACTIONS)
+                    return
+
+                async for chunk in chunks:
+                    async with room:
+                        await room.wait_for(
+                            lambda: job is current or held < max_transactions
+                        )
+                        held += len(chunk["transactions"])
+                    await buffer.put(chunk)
+                self.fetch_latencies[job.iban] = time.monotonic() - started
+                await buffer.put(_DONE)
+            except Exception as err:
+                await buffer.put(err)
+
+        def start_prefetching() -> None:
+            """Start fetching the next accounts, up to the concurrency."""
+            while upcoming and len(prefetching) < concurrency:
+                job = upcoming.popleft()
+                buffer: asyncio.Queue[Any] = asyncio.Queue(maxsize=buffer_size)
+                prefetching.append(
+                    (job, buffer, asyncio.create_task(prefetch(job, buffer)))
+                )
+
+        try:
+            start_prefetching()
+            while prefetching:
+                job, buffer, _task = prefetching[0]
+                async with room:
+                    current = job
+                    room.notify_all()
+
+                item = await buffer.get()
+                if item is not _NO_TRANSACTIONS:
+                    self._emit("TrueLayer: Matching transactions to Firefly account")
+                fetched = 0
+                while item is not _NO_TRANSACTIONS and item is not _DONE:
+                    if isinstance(item, Exception):
+                        raise item
+                    async with room:
+                        held -= len(item["transactions"])
+                        room.notify_all()
+                    stats.observe_queue(
+                        sum(buffer.qsize() for _job, buffer, _task in prefetching)
+                    )
+                    self._announce_chunk(job, item)
+                    fetched += len(item["transactions"])
+                    await outbox.put(_Batch(job, item))
+                    item = await buffer.get()
+
+                prefetching.popleft()
+                start_prefetching()
+                if item is _DONE:
+                    latency = self.fetch_latencies[job.iban]
+                    stats.record(latency)
+                    self._emit(
+                        f"TrueLayer: Fetched {fetched} transaction(s) for {job.iban} in {latency * 1000:.0f} ms"
+                    )
+                    await outbox.put(_Batch(job))
+            await outbox.put(_DONE)
+        finally:
+            for _job, _buffer, task in prefetching:
+                task.cancel()
 
-        truelayer_accounts = response.json()
-        if "results" not in truelayer_accounts:
-            yield "No accounts found in TrueLayer"
+    def _announce_chunk(self, job: _AccountJob, chunk: dict[str, Any]) -> None:
+        """Count the transactions of a fetched chunk and report its window."""
+        if chunk["error"] is not None:
             return
 
-        truelayer_accounts = truelayer_accounts["results"]
-        for account in truelayer_accounts:
-            yield f"TrueLayer account: {account['account_id']} - {account['account_number'].get('iban')}"
+        job.state.total += len(chunk["transactions"])
+        if chunk["from"] is not None:
+            self._emit(
+                f"TrueLayer: Window {chunk['index']}/{chunk['total']} ({chunk['from'].date()} - {chunk['to'].date()}): {len(chunk['transactions'])} transaction(s) found"
+            )
+            self._emit(
+                {
+                    "type": "backfill",
+                    "data": {
+                        "account": job.iban,
+                        "window": chunk["index"],
+                        "total": chunk["total"],
+                        "from": chunk["from"].isoformat(),
+                        "to": chunk["to"].isoformat(),
+                        "transactions": len(chunk["transactions"]),
+                    },
+                }
+            )
+
+    async def _match_batch(self, batch: _Batch) -> _Batch:
+        """Skip the known transactions, then match and create the counterparties."""
+        chunk, job = batch.chunk, batch.job
+        if chunk is None or chunk["error"] is not None:
+            return batch
+        state, import_account = job.state, job.import_account
+        txns = chunk["transactions"]
+
+        # Skip the transactions which are known to be in Firefly already
+        existing: dict[tuple[str, str, str], list[str]] = {}
+        if self._prefetch_existing:
+            unknown = [
+                txn
+                for txn in txns
+                if self._ledger is None or txn["transaction_id"] not in self._ledger
+            ]
+            if unknown:
+                existing = await self._existing_journals(import_account["id"], unknown)
+
+        pending: list[dict[str, Any]] = []
+        for txn in txns:
+            txn_timestamp = parse_timestamp(txn["timestamp"])
+            if self._ledger is not None and txn["transaction_id"] in self._ledger:
+                state.succeed(txn_timestamp)
+                state.skipped += 1
+                state.processed += 1
+                self._emit(
+                    f"Transaction already imported: {txn['description']} - {txn['amount']} - {txn['timestamp']}"
+                )
+                self._emit(state.progress(job.iban))
+                continue
+
+            journals = existing.get(
+                transaction_fingerprint(
+                    txn["timestamp"], txn["amount"], txn["description"]
+                )
+            )
+            if journals:
+                # Every journal in Firefly can only match one transaction
+                journal_id = journals.pop(0)
+                if self._ledger is not None:
+                    self._ledger.record(
+                        txn["transaction_id"], import_account["id"], journal_id
+                    )
+                state.succeed(txn_timestamp)
+                state.existing += 1
+                state.processed += 1
+                self._emit(
+                    f"Transaction already exists: {txn['description']} - {txn['amount']} - {txn['timestamp']}"
+                )
+                self._emit(state.progress(job.iban))
+                continue
+
+            pending.append(txn)
+
+        # Plan, match the counterparties and collect the accounts to create.
+        # A planned account is matched like a created one, so every
+        # counterparty is only created once.
+        planned = AccountIndex()
+        for txn in pending:
+            counterparty = _counterparty(txn)
+            if counterparty is None:
+                state.unmatching += 1
+                self._emit(f"Transaction has no IBAN: {txn['description']}")
+                batch.linked.append((txn, None))
+                continue
+
+            account_type, cp_iban, cp_name = counterparty
+            linked_account, matched_by = self._firefly_accounts.find_counterparty(
+                account_type, cp_iban, cp_name
+            )
+            if linked_account is None:
+                linked_account, matched_by = planned.find_counterparty(
+                    account_type, cp_iban, cp_name
+                )
+
+            if matched_by == "iban":
+                self._emit(
+                    f"Matching account found via IBAN: {txn['description']} - {cp_iban}"
+                )
+                state.matching += 1
+            elif matched_by == "name":
+                self._emit(
+                    f"Matching account found via name: {txn['description']} - {cp_name}"
+                )
+                state.matching += 1
+            else:
+                self._emit(
+                    f"No match, still a valid IBAN. Creating a new account: {txn} - {cp_iban} - {account_type}"
+                )
+                linked_account = {
+                    "id": None,
+                    "attributes": {
+                        "type": account_type,
+                        "name": cp_name or "Unnamed",
+                        "iban": cp_iban,
+                    },
+                }
+                planned.add(linked_account)
+            batch.linked.append((txn, linked_account))
+
+        # Create the new counterparties concurrently
+        results = await asyncio.gather(
+            *(
+                self._create_counterparty(placeholder["attributes"])
+                for placeholder in planned.accounts
+            )
+        )
+        accounts_created_before = self.accounts_created
+        for placeholder, (account, error) in zip(planned.accounts, results):
+            batch.created[_counterparty_key(placeholder["attributes"])] = account
+            if account is None:
+                self._emit(f"Error creating account in Firefly: {error}")
+                continue
+
+            self._emit(
+                f"New account created: {placeholder['attributes']['name']} - {placeholder['attributes']['iban']}"
+            )
+            state.newly_created += 1
+            # Merge the created account instead of refetching all accounts
+            self._firefly_accounts.add(account)
+            if self._account_cache is not None:
+                self._account_cache.add(account)
+            self.accounts_created += 1
+
+        if (
+            self._reconcile_every
+            and self.accounts_created // self._reconcile_every
+            > accounts_created_before // self._reconcile_every
+        ):
+            self._emit("Firefly: Reconciling accounts with Firefly")
+            self._firefly_accounts = await self._reconcile_accounts(
+                self._firefly_accounts
+            )
+        return batch
+
+    async def _map_batch(self, batch: _Batch) -> _Batch:
+        """Map the matched transactions to Firefly transactions."""
+        for txn, linked_account in batch.linked:
+            txn_timestamp = parse_timestamp(txn["timestamp"])
+            if linked_account is not None and linked_account["id"] is None:
+                # Planned counterparty, created by the match stage
+                linked_account = batch.created[
+                    _counterparty_key(linked_account["attributes"])
+                ]
+                if linked_account is None:
+                    # The counterparty could not be created
+                    batch.payloads.append((txn_timestamp, None))
+                    continue
+
+            batch.payloads.append(
+                (
+                    txn_timestamp,
+                    _import_transaction(txn, batch.job.import_account, linked_account),
+                )
+            )
+        return batch
+
+    async def _post_batch(self, batch: _Batch) -> _Batch:
+        """Post the transactions of a batch, then store the progress of the account."""
+        job, chunk = batch.job, batch.chunk
+        state = job.state
+        if chunk is None:
+            self._finish_account(job)
+            return batch
+
+        if chunk["error"] is not None:
+            state.fail(chunk["from"])
+            self._emit(f"Error fetching transactions from TrueLayer: {chunk['error']}")
+            return batch
+
+        failed_before_chunk = state.failed
+        in_flight: dict[asyncio.Task[tuple[str, str]], datetime] = {}
+        try:
+            for txn_timestamp, import_transaction in batch.payloads:
+                if import_transaction is None:
+                    state.fail(txn_timestamp)
+                    state.processed += 1
+                    continue
+
+                in_flight[
+                    asyncio.create_task(self._post_transaction(import_transaction))
+                ] = txn_timestamp
+
+                # Backpressure, wait for a slot once all workers are busy
+                async for event in self._settle_posts(
+                    in_flight, state, job.iban, self._post_concurrency - 1
+                ):
+                    self._emit(event)
+
+            # Window bookkeeping needs the outcome of all its transactions
+            async for event in self._settle_posts(in_flight, state, job.iban, 0):
+                self._emit(event)
+        finally:
+            # Only left over when the stage is cancelled or failed
+            for task in in_flight:
+                task.cancel()
+        if self._ledger is not None:
+            self._ledger.flush()
+
+        if chunk["from"] is not None and state.failed == failed_before_chunk:
+            self._mark_backfill_window_done(job.account_id, chunk["from"])
+        self._emit({"type": "pipeline", "data": self._pipeline_snapshot()})
+        return batch
+
+    def _finish_account(self, job: _AccountJob) -> None:
+        """Store the synchronization of an account and report on it."""
+        state = job.state
+        if not job.months:
+            self._store_sync_cursor(
+                job.account_id, state.latest_synced, state.earliest_failed
+            )
+        elif state.failed == 0:
+            self._store_sync_cursor(
+                job.account_id, state.latest_synced or job.backfill_until, None
+            )
+            self._clear_backfill_progress(job.account_id)
+        else:
+            # Leave the cursor unset, so the next run resumes the backfill
+            self._emit(
+                f"TrueLayer: Backfill for {job.iban} incomplete, it will resume on the next run"
+            )
+        if state.skipped:
+            self._emit(
+                f"Ledger: {state.skipped} already imported transaction(s) skipped"
+            )
+        if state.existing:
+            self._emit(
+                f"Firefly: {state.existing} existing transaction(s) skipped without posting"
+            )
+        self._emit(
+            f"Report: {state.matching} matching and {state.unmatching} unmatching and {state.newly_created} newly created accounts(s)"
+        )
+
+    async def start_import(
+        self, backfill_months: int | None = None
+    ) -> AsyncGenerator[Any, Any]:
+        """Start the import process.
+
+        With `backfill_months`, the history of every account is fetched in monthly
+        windows. Accounts without a sync cursor are backfilled automatically when
+        the `import_backfill_months` setting is configured.
+        """
+
+        stages: list[asyncio.Task[None]] = []
+        try:
+            yield "TrueLayer: Fetching accounts from TrueLayer"
+            accounts_started = time.monotonic()
+            response = await self._truelayer_client.get_accounts()
             await asyncio.sleep(0)
 
-        yield f"TrueLayer: A total of {len(truelayer_accounts)} account(s) found"
-        await asyncio.sleep(0)
+            if response.status_code != 200:
+                yield f"Error fetching accounts from TrueLayer: {response.text}"
+                return
+
+            truelayer_accounts = response.json()
+            if "results" not in truelayer_accounts:
+                yield "No accounts found in TrueLayer"
+                return
+
+            truelayer_accounts = truelayer_accounts["results"]
+            for account in truelayer_accounts:
+                yield f"TrueLayer account: {account['account_id']} - {account['account_number'].get('iban')}"
+                await asyncio.sleep(0)
 
-        yield "Firefly: Fetching accounts from Firefly"
-        firefly_accounts = await self._firefly_client.get_account_paginated()
-        yield f"Firefly: A total of {len(firefly_accounts)} account(s) found"
+            yield f"TrueLayer: A total of {len(truelayer_accounts)} account(s) found"
+            await asyncio.sleep(0)
+
+            yield "Firefly: Fetching accounts from Firefly"
+            self._firefly_accounts = AccountIndex(await self._fetch_firefly_accounts())
+            self.pipeline_stats["accounts"].record(time.monotonic() - accounts_started)
+            yield f"Firefly: A total of {len(self._firefly_accounts)} account(s) found"
+            if self.account_cache_hits:
+                yield f"Firefly: {self.account_cache_hits} account type(s) served from the local cache"
+            self._reconcile_every = self._config.get(
+                "import_account_reconcile_every", 0
+            )
 
-        yield "Matching account(s) between TrueLayer and Firefly"
+            yield "Matching account(s) between TrueLayer and Firefly"
 
-        for truelayer_account in truelayer_accounts:
-            import_account: dict[str, Any] = {}
-            tr_iban = truelayer_account["account_number"].get("iban")
-            yield f"Checking matches for TrueLayer account {tr_iban}"
+            jobs: list[_AccountJob] = []
+            for truelayer_account in truelayer_accounts:
+                import_account: dict[str, Any] = {}
+                tr_iban = truelayer_account["account_number"].get("iban")
+                yield f"Checking matches for TrueLayer account {tr_iban}"
 
-            for firefly_account in firefly_accounts:
-                ff_iban = firefly_account["attributes"].get("iban")
-                if tr_iban == ff_iban:
+                for firefly_account in self._firefly_accounts.with_iban(tr_iban):
                     yield f"Matching account found: {tr_iban}"
                     if (
                         firefly_account["attributes"].get("account_role")
@@ -75,190 +1226,73 @@ class Import2Firefly:
                         break
                     else:
                         yield "Firefly account matched, but is not a default asset"
-            else:
-                yield f"No matching Firefly account found for IBAN {tr_iban}"
-                continue
-
-            yield f"TrueLayer: Fetching transactions for {tr_iban}..."
-            transactions = await self._truelayer_client.get_transactions(
-                truelayer_account["account_id"]
-            )
-
-            if transactions.status_code != 200:
-                yield f"Error fetching transactions from TrueLayer: {transactions.text}"
-                continue
-
-            parsed = transactions.json()
-            if "results" not in parsed:
-                yield "No transactions found in TrueLayer"
-                continue
+                else:
+                    yield f"No matching Firefly account found for IBAN {tr_iban}"
+                    continue
 
-            txns = parsed["results"]
-            yield f"TrueLayer: A total of {len(txns)} transaction(s) found"
-            yield "TrueLayer: Matching transactions to Firefly account"
-
-            matching = 0
-            unmatching = 0
-            newly_created = 0
-            total_transactions = len(txns)
-            for i, txn in enumerate(txns, start=1):
-                cp_iban = txn.get("meta", {}).get("counter_party_iban")
-                cp_name = txn.get("meta", {}).get("counter_party_preferred_name")
-                transaction_type = (
-                    "debit" if txn["transaction_type"].lower() == "debit" else "credit"
+                account_id = truelayer_account["account_id"]
+                sync_from = self._sync_window_start(account_id)
+                months = backfill_months
+                if months is None and sync_from is None:
+                    months = self._config.get("import_backfill_months")
+                jobs.append(
+                    _AccountJob(account_id, tr_iban, import_account, months, sync_from)
                 )
-                linked_account = None
-
-                if cp_iban is not None:
-                    for firefly_account in firefly_accounts:
-                        if (
-                            transaction_type == "debit"
-                            and firefly_account["attributes"]["type"] != "expense"
-                        ):
-                            continue
-                        if (
-                            transaction_type == "credit"
-                            and firefly_account["attributes"]["type"] != "revenue"
-                        ):
-                            continue
-
-                        # Check if the IBAN matches
-                        if cp_iban == firefly_account["attributes"].get("iban"):
-                            yield f"Matching account found via IBAN: {txn['description']} - {cp_iban}"
-                            linked_account = firefly_account
-                            matching += 1
-                            break
-
-                        # Check if the name matches, as a final fallback
-                        # This is not prefered, but can be used if the IBAN is not available or when the  account uses multiple IBANs
-                        # Firefly doesn't allow to create multiple accounts with the same name, so this should be safe
-                        if cp_name is not None and cp_name == firefly_account[
-                            "attributes"
-                        ].get("name"):
-                            yield f"Matching account found via name: {txn['description']} - {cp_name}"
-                            linked_account = firefly_account
-                            matching += 1
-                            break
-
-                    if linked_account is None:
-                        account_type = (
-                            "revenue" if transaction_type == "credit" else "expense"
-                        )
 
-                        yield f"No match, still a valid IBAN. Creating a new account: {txn} - {cp_iban} - {account_type}"
-                        response = await self._firefly_client.create_account(
-                            {
-                                "name": txn.get("meta", {}).get(
-                                    "counter_party_preferred_name"
-                                )
-                                or "Unnamed",
-                                "iban": cp_iban,
-                                "type": (
-                                    "revenue"
-                                    if transaction_type == "credit"
-                                    else "expense"
-                                ),
-                            }
-                        )
+            self._jobs = jobs
 
-                        if response.status_code != 200:
-                            yield f"Error creating account in Firefly: {response.text}"
-                            continue
-                        yield f"New account created: {txn.get('meta', {}).get('counter_party_preferred_name')} - {cp_iban}"
-                        linked_account = response.json()["data"]
-                        newly_created += 1
-
-                        yield "Firefly: Enforcing refresh accounts from Firefly"
-                        firefly_accounts = (
-                            await self._firefly_client.get_account_paginated()
-                        )
-                        yield f"Firefly: A total of {len(firefly_accounts)} account(s) found"
-                else:
-                    unmatching += 1
-                    yield f"Transaction has no IBAN: {txn['description']}"
-
-                # Ensure the amount is always positive
-                amount = abs(txn["amount"])
-                import_transaction = {
-                    "error_if_duplicate_hash": True,
-                    "apply_rules": True,
-                    "fire_webhooks": True,
-                    "transactions": [
-                        {
-                            "description": txn["description"],
-                            "date": txn["timestamp"],
-                            "amount": amount,
-                            "type": (
-                                "deposit"
-                                if transaction_type == "credit"
-                                else "withdrawal"
-                            ),
-                            # SWAP for deposit: asset account is destination, revenue account is source
-                            "destination_id": (
-                                import_account["id"]
-                                if transaction_type == "credit"
-                                else (
-                                    None
-                                    if linked_account is None
-                                    else linked_account["id"]
-                                )
-                            ),
-                            "destination_name": (
-                                import_account["attributes"]["name"]
-                                if transaction_type == "credit"
-                                else (
-                                    "(unknown expense account)"
-                                    if linked_account is None
-                                    else linked_account["attributes"]["name"]
-                                )
-                            ),
-                            "source_id": (
-                                (
-                                    None
-                                    if linked_account is None
-                                    else linked_account["id"]
-                                )
-                                if transaction_type == "credit"
-                                else import_account["id"]
-                            ),
-                            "source_name": (
-                                (
-                                    "(unknown revenue account)"
-                                    if linked_account is None
-                                    else linked_account["attributes"]["name"]
-                                )
-                                if transaction_type == "credit"
-                                else import_account["attributes"]["name"]
-                            ),
-                            "account_id": import_account["id"],
-                            "linked_account_id": txn["transaction_id"],
-                        }
-                    ],
-                }
-                try:
-                    response = await self._firefly_client.create_transaction(
-                        import_transaction
+            # Fetch, match, map and post run concurrently, so the transactions of an
+            # account are fetched while those of the previous account are posted
+            queue_size = max(
+                int(
+                    self._config.get(
+                        "import_pipeline_queue_size", DEFAULT_PIPELINE_QUEUE_SIZE
                     )
-                except Exception as e:
-                    yield f"Error creating transaction in Firefly: {e}"
-
-                if response.status_code == 200:
-                    yield f"Transaction created: {txn['description']} - {txn['amount']} - {txn['timestamp']}"
-                elif response.status_code == 442:
-                    yield f"Transaction already exists: {txn['description']} - {txn['amount']} - {txn['timestamp']}"
-                else:
-                    yield f"Error creating transaction in Firefly: {response.text}"
-                await asyncio.sleep(0)
+                ),
+                1,
+            )
+            fetched, matched, mapped = (
+                asyncio.Queue(maxsize=queue_size) for _ in range(3)
+            )
+            self._events = asyncio.Queue()
+            self._queues = {"match": fetched, "map": matched, "post": mapped}
+            stages += [
+                asyncio.create_task(self._guard_stage(stage))
+                for stage in (
+                    self._fetch_stage(jobs, fetched),
+                    self._run_stage("match", self._match_batch, fetched, matched),
+                    self._run_stage("map", self._map_batch, matched, mapped),
+                    self._run_stage("post", self._post_batch, mapped, None),
+                )
+            ]
+            running = len(stages)
+            while running:
+                event = await self._events.get()
+                if isinstance(event, _StageEnd):
+                    running -= 1
+                    if event.error is not None:
+                        raise event.error
+                    continue
+                yield event
 
-                yield {
-                    "type": "progress",
-                    "data": {
-                        "account": tr_iban,
-                        "current": i,
-                        "total": total_transactions,
-                    },
-                }
-                await asyncio.sleep(0.05)
+            if self.accounts_created and self._config.get(
+                "import_account_reconcile_at_end", False
+            ):
+                yield "Firefly: Reconciling accounts with Firefly"
+                self._firefly_accounts = await self._reconcile_accounts(
+                    self._firefly_accounts
+                )
 
-            yield f"Report: {matching} matching and {unmatching} unmatching and {newly_created} newly created accounts(s)"
-            await asyncio.sleep(0)
+            yield f"Firefly: {self.account_refreshes_avoided} full account refresh(es) avoided"
+            for name, stats in self.pipeline_stats.items():
+                yield f"Pipeline: {name} handled {stats.items} item(s), {stats.average_latency * 1000:.0f} ms average latency, queue depth up to {stats.max_queue_depth}"
+            yield {"type": "pipeline", "data": self._pipeline_snapshot()}
+        finally:
+            for stage in stages:
+                stage.cancel()
+            # Wait for the stages, so nothing writes to the stores once closed
+            await asyncio.gather(*stages, return_exceptions=True)
+            if self._account_cache is not None:
+                self._account_cache.close()
+            if self._ledger is not None:
+                self._ledger.close()
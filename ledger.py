@@ -0,0 +1,298 @@
+"""Local ledger of the TrueLayer transactions imported into Firefly.
+
+The ledger maps every imported TrueLayer transaction id to its Firefly journal,
+so an import can skip transactions it stored before without sending them to
+Firefly again. All ids are kept in memory as well, making a lookup O(1).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections.abc import AsyncGenerator
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+import logging
+from pathlib import Path
+import sqlite3
+import time
+from typing import Any, Self
+
+from account_index import AccountIndex
+from clients.firefly import FireflyClient
+from clients.truelayer import TrueLayerClient
+from config import Config, get_config
+from sqlite_store import SQLiteStore
+
+_LOGGER = logging.getLogger(__name__)
+
+LEDGER_FILE = "import_ledger.sqlite"
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id TEXT PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    journal_id TEXT,
+    imported_at REAL NOT NULL
+);
+"""
+
+
+def transaction_fingerprint(
+    timestamp: str, amount: Any, description: str | None
+) -> tuple[str, str, str]:
+    """Get the fields identifying a transaction in both TrueLayer and Firefly.
+
+    The timestamp is compared in UTC and the amount without sign, with two
+    decimals, since Firefly uses its own timezone and stores amounts as strings.
+    """
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return (
+        moment.astimezone(UTC).isoformat(),
+        f"{abs(Decimal(str(amount))):.2f}",
+        description or "",
+    )
+
+
+class ImportLedger(SQLiteStore):
+    """SQLite ledger of imported TrueLayer transactions."""
+
+    schema = SCHEMA
+    schema_version = SCHEMA_VERSION
+    tables = ("transactions",)
+    outdated_message = "Import ledger belongs to another Firefly, clearing it"
+    outdated_level = logging.WARNING
+
+    def __init__(self, path: Path, source: str | None = None) -> None:
+        """Initialize the ledger of the Firefly instance at `source`."""
+        super().__init__(path, source)
+        self._known: set[str] | None = None
+
+    @classmethod
+    def from_config(cls, config: Config) -> Self:
+        """Create the ledger next to the configuration file."""
+        return cls(
+            config.path.parent / LEDGER_FILE, source=config.get("firefly_api_url")
+        )
+
+    def _configure(self, connection: sqlite3.Connection) -> None:
+        """Let imports and rebuilds read while the ledger is written."""
+        connection.execute("PRAGMA journal_mode=WAL")
+
+    @property
+    def known(self) -> set[str]:
+        """Get the ids of all imported transactions."""
+        if self._known is None:
+            self._known = {
+                transaction_id
+                for (transaction_id,) in self.connection.execute(
+                    "SELECT transaction_id FROM transactions"
+                )
+            }
+        return self._known
+
+    def __contains__(self, transaction_id: object) -> bool:
+        """Check if a transaction was imported before."""
+        return transaction_id in self.known
+
+    def __len__(self) -> int:
+        """Get the number of imported transactions."""
+        return len(self.known)
+
+    def record(
+        self, transaction_id: str, account_id: str, journal_id: str | None
+    ) -> None:
+        """Record a transaction imported into a Firefly account.
+
+        Call `flush` to persist it.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO transactions "
+            "(transaction_id, account_id, journal_id, imported_at) "
+            "VALUES (?, ?, ?, ?)",
+            (transaction_id, account_id, journal_id, time.time()),
+        )
+        self.known.add(transaction_id)
+
+    def journal_id(self, transaction_id: str) -> str | None:
+        """Get the Firefly journal of an imported transaction, when known."""
+        row = self.connection.execute(
+            "SELECT journal_id FROM transactions WHERE transaction_id = ?",
+            (transaction_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def flush(self) -> None:
+        """Persist the recorded transactions."""
+        if self._connection is not None:
+            self._connection.commit()
+
+    def replace(
+        self,
+        records: list[tuple[str, str, str | None]],
+        stale: set[str],
+        accounts: set[str],
+    ) -> None:
+        """Replace the transactions of a rebuild in a single database transaction.
+
+        The `stale` transactions and all transactions of the `accounts` are
+        forgotten, then the `records` of transaction, account and journal id are
+        stored, so a failed rebuild leaves the ledger as it was.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM transactions WHERE transaction_id = ?",
+                [(transaction_id,) for transaction_id in stale],
+            )
+            self.connection.executemany(
+                "DELETE FROM transactions WHERE account_id = ?",
+                [(account_id,) for account_id in accounts],
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO transactions "
+                "(transaction_id, account_id, journal_id, imported_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(*record, now) for record in records],
+            )
+        self._known = None
+
+
+def index_journals(
+    groups: list[dict[str, Any]],
+) -> dict[tuple[str, str, str], list[str]]:
+    """Index the journals of Firefly transaction groups by their fingerprint.
+
+    Identical transactions share a fingerprint, so every fingerprint maps to
+    the ids of all its journals.
+    """
+    journals: dict[tuple[str, str, str], list[str]] = {}
+    for group in groups:
+        for split in group["attributes"]["transactions"]:
+            journals.setdefault(
+                transaction_fingerprint(
+                    split["date"], split["amount"], split.get("description")
+                ),
+                [],
+            ).append(str(split["transaction_journal_id"]))
+    return journals
+
+
+async def rebuild_ledger(
+    ledger: ImportLedger,
+    truelayer_client: TrueLayerClient,
+    firefly_client: FireflyClient,
+    since: datetime | None = None,
+) -> AsyncGenerator[str, None]:
+    """Rebuild the ledger from the transactions stored in Firefly.
+
+    Firefly does not store the TrueLayer transaction id, so the transactions of
+    every account are fetched from both TrueLayer and Firefly, and matched on
+    their timestamp, amount and description. The ledger is only changed once
+    every account is matched; with `since`, older transactions are kept.
+    """
+    yield "TrueLayer: Fetching accounts from TrueLayer"
+    response = await truelayer_client.get_accounts()
+    if response.status_code != 200:
+        yield f"Error fetching accounts from TrueLayer: {response.text}"
+        return
+
+    asset_accounts = AccountIndex(
+        await firefly_client.get_account_paginated(account_type="asset")
+    )
+    records: list[tuple[str, str, str | None]] = []
+    stale: set[str] = set()
+    accounts: set[str] = set()
+
+    for account in response.json().get("results", []):
+        iban = account["account_number"].get("iban")
+        firefly_account = next(
+            (
+                candidate
+                for candidate in asset_accounts.with_iban(iban)
+                if candidate["attributes"].get("account_role") == "defaultAsset"
+            ),
+            None,
+        )
+        if firefly_account is None:
+            yield f"No matching Firefly account found for IBAN {iban}"
+            continue
+
+        transactions = await truelayer_client.get_transactions(
+            account["account_id"], from_date=since
+        )
+        if transactions.status_code != 200:
+            yield f"Error fetching transactions from TrueLayer: {transactions.text}"
+            continue
+        txns = transactions.json().get("results", [])
+        if since is None:
+            accounts.add(firefly_account["id"])
+        if not txns:
+            continue
+
+        # A day of margin on both sides, Firefly filters on its own timezone
+        dates = [datetime.fromisoformat(txn["timestamp"]).date() for txn in txns]
+        journals = index_journals(
+            await firefly_client.get_account_transactions(
+                firefly_account["id"],
+                start=min(dates) - timedelta(days=1),
+                end=max(dates) + timedelta(days=1),
+            )
+        )
+
+        matched = 0
+        for txn in txns:
+            fingerprint = transaction_fingerprint(
+                txn["timestamp"], txn["amount"], txn["description"]
+            )
+            if journals.get(fingerprint):
+                journal_id = journals[fingerprint].pop(0)
+                records.append(
+                    (txn["transaction_id"], firefly_account["id"], journal_id)
+                )
+                matched += 1
+            else:
+                stale.add(txn["transaction_id"])
+        yield f"Ledger: {matched} of {len(txns)} transaction(s) of {iban} found in Firefly"
+
+    ledger.replace(records, stale, accounts)
+    yield f"Ledger: A total of {len(ledger)} imported transaction(s) known"
+
+
+async def _main(days: int | None) -> None:
+    """Rebuild the ledger with the configured clients."""
+    config = get_config()
+    since = datetime.now(UTC) - timedelta(days=days) if days else None
+    ledger = ImportLedger.from_config(config)
+    try:
+        async with (
+            TrueLayerClient(config=config) as truelayer_client,
+            FireflyClient(config=config) as firefly_client,
+        ):
+            async for message in rebuild_ledger(
+                ledger, truelayer_client, firefly_client, since
+            ):
+                _LOGGER.info("%s", message)
+    finally:
+        ledger.close()
+        config.flush()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    parser = argparse.ArgumentParser(description="Manage the local import ledger.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild = subparsers.add_parser(
+        "rebuild", help="Rebuild the ledger from the transactions in Firefly."
+    )
+    rebuild.add_argument(
+        "--days", type=int, help="Only look at the transactions of the last days."
+    )
+    args = parser.parse_args()
+    asyncio.run(_main(args.days))
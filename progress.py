@@ -0,0 +1,138 @@
+"""Coalesce the events of an import into a limited number of SSE frames."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncGenerator, AsyncIterator
+import json
+import time
+from typing import Any
+
+DEFAULT_MAX_FRAME_RATE = 10.0
+
+_END = object()
+
+
+def sse_frame(data: Any, event: str | None = None) -> str:
+    """Format a Server-Sent Events frame with JSON data."""
+    if event is None:
+        return f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ProgressEmitter:
+    """Turn import events into SSE frames, at most `max_frame_rate` per second.
+
+    The import runs in its own task and is never slowed down by the stream. Log
+    lines received in between two frames are sent together as a single `log`
+    event, and only the latest `progress` event of every account is sent,
+    extended with the throughput and the estimated time remaining. Other events,
+    like `backfill`, are sent right away.
+    """
+
+    def __init__(
+        self,
+        events: AsyncIterator[Any],
+        max_frame_rate: float = DEFAULT_MAX_FRAME_RATE,
+    ) -> None:
+        """Initialize the emitter for the events of an import."""
+        self._events = events
+        self._interval = 1 / max_frame_rate if max_frame_rate > 0 else 0.0
+        self._lines: list[str] = []
+        self._progress: dict[str, dict[str, Any]] = {}
+        self._started: dict[str, tuple[float, int]] = {}
+        self.events_received = 0
+        self.frames_sent = 0
+
+    async def _pump(self, queue: asyncio.Queue[Any]) -> None:
+        """Move the events of the import into the queue."""
+        try:
+            async for event in self._events:
+                queue.put_nowait(event)
+        finally:
+            queue.put_nowait(_END)
+
+    def _add(self, event: Any) -> str | None:
+        """Buffer an event, or get the frame of an event which can't wait."""
+        self.events_received += 1
+        if not isinstance(event, dict):
+            self._lines.append(str(event))
+            return None
+
+        if event.get("type") == "progress":
+            data = event["data"]
+            self._started.setdefault(
+                data["account"], (time.monotonic(), data["current"])
+            )
+            self._progress[data["account"]] = data
+            return None
+
+        return sse_frame(event["data"], event["type"])
+
+    def _throughput(self, data: dict[str, Any]) -> dict[str, Any]:
+        """Add the throughput and estimated time remaining to a progress event."""
+        started_at, started_with = self._started[data["account"]]
+        elapsed = time.monotonic() - started_at
+        done = data["current"] - started_with
+        if elapsed <= 0 or done <= 0:
+            return {**data, "rate": None, "eta": None}
+
+        rate = done / elapsed
+        return {
+            **data,
+            "rate": round(rate, 1),
+            "eta": round(max(data["total"] - data["current"], 0) / rate, 1),
+        }
+
+    def _flush(self) -> list[str]:
+        """Get the frames of all buffered events."""
+        frames = []
+        if self._lines:
+            frames.append(sse_frame(self._lines, "log"))
+            self._lines = []
+        for data in self._progress.values():
+            frames.append(sse_frame(self._throughput(data), "progress"))
+        self._progress = {}
+        self.frames_sent += len(frames)
+        return frames
+
+    async def frames(self) -> AsyncGenerator[str, None]:
+        """Run the import and generate its SSE frames.
+
+        An error raised by the import is raised again once the frames of the
+        events before it have been generated.
+        """
+        queue: asyncio.Queue[Any] = asyncio.Queue()
+        pump = asyncio.create_task(self._pump(queue))
+        next_flush = time.monotonic()
+        try:
+            while True:
+                timeout = None
+                if self._lines or self._progress:
+                    timeout = max(next_flush - time.monotonic(), 0)
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except TimeoutError:
+                    event = None
+
+                if event is _END:
+                    break
+                if event is not None and (frame := self._add(event)) is not None:
+                    # Keep the order, the buffered events happened before this one
+                    for buffered in self._flush():
+                        yield buffered
+                    yield frame
+                    self.frames_sent += 1
+                    continue
+
+                if time.monotonic() >= next_flush and (self._lines or self._progress):
+                    for buffered in self._flush():
+                        yield buffered
+                    next_flush = time.monotonic() + self._interval
+
+            for buffered in self._flush():
+                yield buffered
+            await pump
+        finally:
+            if not pump.done():
+                pump.cancel()
@@ -0,0 +1,112 @@
+"""Local history of the import runs and their statistics.
+
+Every run is stored with its outcome, the counters of every account, and the
+number and latency of the calls made to TrueLayer and Firefly, so the
+performance of imports can be compared over time.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from pathlib import Path
+from typing import Any, Self
+
+from config import Config
+from sqlite_store import SQLiteStore
+
+RUN_HISTORY_FILE = "run_history.sqlite"
+DEFAULT_RUN_HISTORY_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    trigger TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    outcome TEXT NOT NULL,
+    run TEXT NOT NULL
+);
+"""
+
+
+def percentiles(samples: list[float]) -> dict[str, float | None]:
+    """Get the median, 90th and 99th percentile and maximum, in milliseconds."""
+    if not samples:
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+
+    ordered = sorted(samples)
+
+    def rank(percentile: int) -> float:
+        """Get a percentile with the nearest-rank method."""
+        index = math.ceil(percentile / 100 * len(ordered)) - 1
+        return round(ordered[max(index, 0)] * 1000, 1)
+
+    return {
+        "p50_ms": rank(50),
+        "p90_ms": rank(90),
+        "p99_ms": rank(99),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+class RunHistory(SQLiteStore):
+    """SQLite history of the latest import runs."""
+
+    schema = SCHEMA
+
+    def __init__(self, path: Path, max_runs: int = DEFAULT_RUN_HISTORY_SIZE) -> None:
+        """Initialize the history, keeping at most `max_runs` runs."""
+        super().__init__(path)
+        self.max_runs = max_runs
+
+    @classmethod
+    def from_config(cls, config: Config) -> Self:
+        """Create the history next to the configuration file."""
+        return cls(
+            config.path.parent / RUN_HISTORY_FILE,
+            max_runs=int(
+                config.get("import_run_history_size", DEFAULT_RUN_HISTORY_SIZE)
+            ),
+        )
+
+    def record(self, run: dict[str, Any]) -> None:
+        """Store a finished run, forgetting the oldest runs."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO runs "
+                "(id, trigger, started_at, finished_at, outcome, run) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    run["id"],
+                    run["trigger"],
+                    run["started_at"],
+                    run["finished_at"],
+                    run["outcome"],
+                    json.dumps(run),
+                ),
+            )
+            self.connection.execute(
+                "DELETE FROM runs WHERE id NOT IN "
+                "(SELECT id FROM runs ORDER BY rowid DESC LIMIT ?)",
+                (self.max_runs,),
+            )
+
+    def page(self, limit: int, offset: int = 0) -> tuple[list[dict[str, Any]], int]:
+        """Get a page of runs, newest first, and the number of stored runs."""
+        runs = [
+            json.loads(run)
+            for (run,) in self.connection.execute(
+                "SELECT run FROM runs ORDER BY rowid DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            )
+        ]
+        (total,) = self.connection.execute("SELECT COUNT(*) FROM runs").fetchone()
+        return runs, total
+
+    def get(self, run_id: str) -> dict[str, Any] | None:
+        """Get a stored run."""
+        row = self.connection.execute(
+            "SELECT run FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
@@ -2,32 +2,101 @@
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import math
 from typing import Any
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-import asyncio
 
+from clients.call_budget import CallBudget
 from clients.firefly import FireflyClient
 from clients.truelayer import TrueLayerClient
-from importer2firefly import Import2Firefly
+from import_runner import ImportRunner
 
-from config import Config
+from config import Config, get_config
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def runs_per_day(schedule: str) -> int:
+    """Count how often a cron schedule fires in the next 24 hours."""
+    trigger = CronTrigger.from_crontab(schedule)
+    now = datetime.now(trigger.timezone)
+    end = now + timedelta(days=1)
+
+    runs = 0
+    fire_time = trigger.get_next_fire_time(None, now)
+    while fire_time is not None and fire_time < end:
+        runs += 1
+        fire_time = trigger.get_next_fire_time(
+            fire_time, fire_time + timedelta(seconds=1)
+        )
+    return runs
+
+
 class Scheduler:
     """Class to handle the scheduler workflow."""
 
-    def __init__(self, schedule: str | None = None) -> None:
-        """Initialize the Scheduler class."""
-        self._config: Config = Config()
+    def __init__(
+        self,
+        schedule: str | None = None,
+        truelayer_client: TrueLayerClient | None = None,
+        firefly_client: FireflyClient | None = None,
+        config: Config | None = None,
+        runner: ImportRunner | None = None,
+    ) -> None:
+        """Initialize the Scheduler class.
+
+        Pass the `runner` shared with the web interface, so scheduled and manual
+        imports never run at the same time.
+        """
+        self._config: Config = config or get_config()
+        self._runner: ImportRunner = runner or ImportRunner(
+            truelayer_client=truelayer_client,
+            firefly_client=firefly_client,
+            config=self._config,
+        )
         self._scheduler: AsyncIOScheduler = AsyncIOScheduler()
         self._import_job: AsyncIOScheduler = None
         self._schedule: str | None = schedule or self._config.get("import_schedule")
 
+    def _apply_call_budget(self, schedule: str) -> str:
+        """Check a schedule against the daily TrueLayer call budget.
+
+        Every run calls each TrueLayer endpoint once. A schedule running more
+        often than the budget allows is logged, or clamped to an hourly interval
+        which fits the budget when `scheduler_clamp_to_call_budget` is enabled.
+        """
+        budget = CallBudget(self._config).daily_budget
+        if budget <= 0:
+            return schedule
+
+        runs = runs_per_day(schedule)
+        if runs <= budget:
+            return schedule
+
+        if not self._config.get("scheduler_clamp_to_call_budget", False):
+            _LOGGER.warning(
+                "Schedule %s runs %s times a day, which exceeds the daily TrueLayer "
+                "call budget of %s. Your bank might reject the unattended calls",
+                schedule,
+                runs,
+                budget,
+            )
+            return schedule
+
+        clamped = f"0 */{math.ceil(24 / budget)} * * *"
+        _LOGGER.warning(
+            "Schedule %s runs %s times a day, which exceeds the daily TrueLayer "
+            "call budget of %s. Clamping the schedule to %s",
+            schedule,
+            runs,
+            budget,
+            clamped,
+        )
+        return clamped
+
     def start(self) -> None:
         """Start the scheduler."""
         _LOGGER.info("Starting the scheduler, with schedule: %s", self._schedule)
@@ -38,25 +107,17 @@ class Scheduler:
         if self._import_job:
             self._scheduler.remove_job(self._import_job.id)
 
-        loop = asyncio.get_event_loop()
+        self._schedule = self._apply_call_budget(self._schedule)
 
         async def run_import() -> None:
-            """Run the import job."""
-            start_time = datetime.now()
-            _LOGGER.info("Running import job, started at %s", start_time)
-            importer = Import2Firefly()
-
-            async def consume_import():
-                try:
-                    async for event in importer.start_import():
-                        _LOGGER.info(f"Import event: {event}")
-                except Exception as e:
-                    _LOGGER.error(f"Error during import: {e}")
-
-            asyncio.run_coroutine_threadsafe(consume_import(), loop)
-            end_time = datetime.now()
-            elapsed_time = end_time - start_time
-            _LOGGER.info("Import job completed elapsed time: %s", elapsed_time)
+            """Run the import job, waiting for it to finish."""
+            _LOGGER.info("Running import job, started at %s", datetime.now())
+            run = await self._runner.run_to_completion("schedule")
+            _LOGGER.info(
+                "Import job %s, elapsed time: %s",
+                run.outcome,
+                timedelta(seconds=run.duration),
+            )
 
         self._import_job = self._scheduler.add_job(
             run_import,
@@ -65,6 +126,8 @@ class Scheduler:
             replace_existing=True,
             misfire_grace_time=30,
             coalesce=True,
+            # Overlapping runs are handled by the import overlap policy
+            max_instances=3,
         )
         self._scheduler.start()
         _LOGGER.info("Scheduler started")
@@ -84,6 +147,7 @@ class Scheduler:
             self._import_job = None
             return
 
+        self._schedule = self._apply_call_budget(self._schedule)
         if self._import_job:
             self._scheduler.reschedule_job(
                 self._import_job.id,
@@ -0,0 +1,81 @@
+"""Base class of the local SQLite stores kept next to the configuration.
+
+A store opens its database on first use, creates its schema, and, when it has a
+schema version, starts over once the stored data belongs to another Firefly
+instance or an older schema.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import sqlite3
+from typing import ClassVar
+
+_LOGGER = logging.getLogger(__name__)
+
+METADATA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteStore:
+    """SQLite database with a lazily opened connection."""
+
+    # Tables and indexes, created when the database is opened
+    schema: ClassVar[str] = ""
+    # Version of the schema, None when the store keeps no metadata
+    schema_version: ClassVar[int | None] = None
+    # Tables emptied when the metadata does not match
+    tables: ClassVar[tuple[str, ...]] = ()
+    # Logged when the stored data is cleared
+    outdated_message: ClassVar[str] = "Local store is outdated, clearing it"
+    outdated_level: ClassVar[int] = logging.INFO
+
+    def __init__(self, path: Path, source: str | None = None) -> None:
+        """Initialize the store of the Firefly instance at `source`."""
+        self.path = path
+        self.source = source or ""
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Get the database connection, creating the schema when needed."""
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._configure(self._connection)
+            self._connection.executescript(self.schema)
+            if self.schema_version is not None:
+                self._connection.executescript(METADATA_SCHEMA)
+                self._check_metadata()
+        return self._connection
+
+    def _configure(self, connection: sqlite3.Connection) -> None:
+        """Set up a new connection, before the schema is created."""
+
+    def _check_metadata(self) -> None:
+        """Start over when the data belongs to another Firefly or schema."""
+        metadata = dict(self._connection.execute("SELECT key, value FROM metadata"))
+        expected = {"source": self.source, "schema_version": str(self.schema_version)}
+        if metadata == expected:
+            return
+
+        if metadata:
+            _LOGGER.log(self.outdated_level, self.outdated_message)
+        with self._connection:
+            for table in (*self.tables, "metadata"):
+                self._connection.execute(f"DELETE FROM {table}")
+            self._connection.executemany(
+                "INSERT INTO metadata (key, value) VALUES (?, ?)", expected.items()
+            )
+
+    def close(self) -> None:
+        """Persist pending changes and close the database connection."""
+        if self._connection is not None:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,75 @@
+"""Tests for the local Firefly account cache."""
+
+from pathlib import Path
+from typing import Any
+
+from account_cache import AccountCache
+
+
+def _account(account_id: str, account_type: str, name: str) -> dict[str, Any]:
+    """Create a Firefly account with some fields the cache does not keep."""
+    return {
+        "id": account_id,
+        "type": "accounts",
+        "attributes": {
+            "type": account_type,
+            "name": name,
+            "iban": f"NL00BANK{account_id}",
+            "account_role": None,
+            "current_balance": "12.34",
+        },
+    }
+
+
+def test_replace_and_load(tmp_path: Path) -> None:
+    """Test the compact accounts of a type survive a new cache instance."""
+    cache = AccountCache(tmp_path / "accounts.sqlite", source="https://firefly")
+    assert cache.load("expense") is None
+
+    cache.replace(
+        "expense", [_account("2", "expense", "B"), _account("1", "expense", "A")]
+    )
+    cache.close()
+
+    cache = AccountCache(tmp_path / "accounts.sqlite", source="https://firefly")
+    accounts, total, _synced_at = cache.load("expense")
+    assert total == 2
+    assert [account["id"] for account in accounts] == ["2", "1"]
+    assert "current_balance" not in accounts[0]["attributes"]
+    assert cache.load("revenue") is None
+
+
+def test_add_keeps_total_in_sync(tmp_path: Path) -> None:
+    """Test accounts created during an import are added to their type."""
+    cache = AccountCache(tmp_path / "accounts.sqlite")
+    cache.replace("expense", [_account("1", "expense", "A")])
+
+    cache.add(_account("2", "expense", "B"))
+    cache.add(_account("3", "revenue", "C"))
+
+    accounts, total, _synced_at = cache.load("expense")
+    assert total == 2
+    assert [account["id"] for account in accounts] == ["1", "2"]
+    assert cache.load("revenue") is None
+
+
+def test_other_firefly_instance_clears_cache(tmp_path: Path) -> None:
+    """Test the cache is not used for another Firefly instance."""
+    cache = AccountCache(tmp_path / "accounts.sqlite", source="https://old")
+    cache.replace("asset", [_account("1", "asset", "Checking")])
+    cache.close()
+
+    cache = AccountCache(tmp_path / "accounts.sqlite", source="https://new")
+    assert cache.load("asset") is None
+
+
+def test_invalidate_forgets_type(tmp_path: Path) -> None:
+    """Test an invalidated type is fetched again, the other types are kept."""
+    cache = AccountCache(tmp_path / "accounts.sqlite")
+    cache.replace("expense", [_account("1", "expense", "A")])
+    cache.replace("revenue", [_account("2", "revenue", "B")])
+
+    cache.invalidate("expense")
+
+    assert cache.load("expense") is None
+    assert cache.load("revenue")[1] == 1
@@ -0,0 +1,84 @@
+"""Tests for the Firefly account index."""
+
+from typing import Any
+
+from account_index import AccountIndex, normalize_iban
+
+
+def _account(
+    account_id: str,
+    account_type: str,
+    name: str,
+    iban: str | None = None,
+    role: str | None = None,
+) -> dict[str, Any]:
+    """Create a Firefly account as returned by the API."""
+    return {
+        "id": account_id,
+        "attributes": {
+            "type": account_type,
+            "name": name,
+            "iban": iban,
+            "account_role": role,
+        },
+    }
+
+
+def test_normalize_iban() -> None:
+    """Test IBANs are compared without spaces and case."""
+    assert normalize_iban("nl91 abna 0417 1643 00") == "NL91ABNA0417164300"
+    assert normalize_iban("") is None
+    assert normalize_iban(None) is None
+
+
+def test_counterparty_iban_takes_precedence() -> None:
+    """Test the IBAN match wins over a name match on another account."""
+    index = AccountIndex(
+        [
+            _account("1", "expense", "Shop"),
+            _account("2", "expense", "Other shop", "NL91ABNA0417164300"),
+        ]
+    )
+
+    account, matched_by = index.find_counterparty(
+        "expense", "NL91 ABNA 0417 1643 00", "Shop"
+    )
+    assert account["id"] == "2"
+    assert matched_by == "iban"
+
+
+def test_counterparty_name_fallback_and_type() -> None:
+    """Test the name is a fallback and the account type must match."""
+    index = AccountIndex(
+        [
+            _account("1", "revenue", "Shop", "NL91ABNA0417164300"),
+            _account("2", "expense", "Shop"),
+        ]
+    )
+
+    account, matched_by = index.find_counterparty(
+        "expense", "NL91ABNA0417164300", "Shop"
+    )
+    assert account["id"] == "2"
+    assert matched_by == "name"
+    assert index.find_counterparty("expense", "NL00UNKNOWN", "Unknown") == (
+        None,
+        None,
+    )
+
+
+def test_with_iban_keeps_order() -> None:
+    """Test all accounts with an IBAN are returned in the original order."""
+    index = AccountIndex(
+        [
+            _account("1", "asset", "Savings", "NL91ABNA0417164300", "savingAsset"),
+            _account("2", "asset", "Checking", "NL91ABNA0417164300", "defaultAsset"),
+        ]
+    )
+
+    assert [account["id"] for account in index.with_iban("NL91ABNA0417164300")] == [
+        "1",
+        "2",
+    ]
+    assert index.with_iban(None) == []
+    assert len(index) == 2
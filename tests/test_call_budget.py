@@ -0,0 +1,70 @@
+"""Tests for the TrueLayer call budget."""
+
+from pathlib import Path
+
+import pytest
+
+from clients.call_budget import CALL_BUDGET_KEY, CallBudget
+from config import Config
+
+
+async def test_record_calls(tmp_path: Path) -> None:
+    """Test calls are counted per provider and per endpoint, and stored later."""
+    config = Config(tmp_path / "config.json")
+    config.set("truelayer_provider_id", "ob-bank")
+    budget = CallBudget(config)
+
+    budget.record("accounts")
+    budget.record("accounts")
+    budget.record("accounts/1/transactions")
+
+    assert budget.used("accounts") == 2
+    assert budget.remaining("accounts") == 2
+    assert budget.remaining("accounts/1/transactions") == 3
+    assert config.get(CALL_BUDGET_KEY) is None
+
+    budget.save()
+    assert config.get(CALL_BUDGET_KEY)["calls"] == {
+        "ob-bank": {"accounts": 2, "accounts/1/transactions": 1}
+    }
+
+
+def test_nearly_exhausted(tmp_path: Path) -> None:
+    """Test the reserve marks the budget as nearly used up."""
+    config = Config(tmp_path / "config.json")
+    config.update(
+        {"truelayer_daily_call_budget": 3, "truelayer_call_budget_reserve": 1}
+    )
+    budget = CallBudget(config)
+
+    budget.record("accounts")
+    assert not budget.nearly_exhausted("accounts")
+    budget.record("accounts")
+    assert budget.nearly_exhausted("accounts")
+
+
+def test_disabled_budget(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    """Test a budget of 0 never runs out and never warns."""
+    config = Config(tmp_path / "config.json")
+    config.set("truelayer_daily_call_budget", 0)
+    budget = CallBudget(config)
+
+    for _ in range(3):
+        budget.record("accounts")
+
+    assert not budget.nearly_exhausted("accounts")
+    assert "exceeded" not in caplog.text
+
+
+def test_counters_reset_on_new_day(tmp_path: Path) -> None:
+    """Test the counters of a previous day are ignored."""
+    config = Config(tmp_path / "config.json")
+    config.set(
+        CALL_BUDGET_KEY,
+        {"date": "2000-01-01", "calls": {"default": {"accounts": 10}}},
+    )
+    budget = CallBudget(config)
+
+    assert budget.used("accounts") == 0
+    budget.record("accounts")
+    assert budget.used("accounts") == 1
@@ -0,0 +1,94 @@
+"""Tests for the Config class."""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from config import Config
+
+
+def test_get_uses_in_memory_snapshot(tmp_path: Path) -> None:
+    """Test repeated lookups do not re-read the configuration file."""
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"key": "value"}), encoding="utf-8")
+
+    config = Config(path)
+    for _ in range(100):
+        assert config.get("key") == "value"
+
+    assert config.disk_reads == 1
+
+
+def test_own_writes_do_not_trigger_reload(tmp_path: Path) -> None:
+    """Test values written by this process are served from memory."""
+    config = Config(tmp_path / "config.json")
+    config.set("key", "value")
+    config.update({"other": 1})
+
+    assert config.get("key") == "value"
+    assert config.get("other") == 1
+    assert config.disk_reads == 1
+
+
+def test_external_change_is_picked_up(tmp_path: Path) -> None:
+    """Test the configuration reloads when the file changes on disk."""
+    path = tmp_path / "config.json"
+    config = Config(path, check_interval=0)
+    config.set("key", "value")
+
+    path.write_text(json.dumps({"key": "changed by another process"}))
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert config.get("key") == "changed by another process"
+    assert config.disk_reads == 2
+
+
+def test_transaction_writes_once(tmp_path: Path) -> None:
+    """Test a transaction applies several keys with a single write."""
+    path = tmp_path / "config.json"
+    config = Config(path)
+
+    with config.transaction():
+        config.set("first", 1)
+        config.set("second", 2)
+        config.delete("first")
+        assert config.disk_writes == 0
+
+    assert config.disk_writes == 1
+    assert json.loads(path.read_text()) == {"second": 2}
+    assert not (tmp_path / ".config.json.tmp").exists()
+
+
+def test_transaction_rolls_back_on_error(tmp_path: Path) -> None:
+    """Test a failing transaction leaves the configuration untouched."""
+    path = tmp_path / "config.json"
+    config = Config(path)
+    config.set("key", "value")
+
+    try:
+        with config.transaction():
+            config.set("key", "changed")
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert config.get("key") == "value"
+    assert config.disk_writes == 1
+    assert json.loads(path.read_text()) == {"key": "value"}
+
+
+async def test_concurrent_writes_are_coalesced(tmp_path: Path) -> None:
+    """Test bursts of writes from coroutines result in a single flush."""
+    path = tmp_path / "config.json"
+    config = Config(path)
+
+    async def writer(index: int) -> None:
+        config.set(f"key_{index}", index)
+
+    await asyncio.gather(*(writer(index) for index in range(10)))
+    await asyncio.sleep(0)
+
+    assert config.disk_writes == 1
+    assert len(json.loads(path.read_text())) == 10
@@ -0,0 +1,44 @@
+"""Tests for the Firefly client."""
+
+from pathlib import Path
+
+from httpx import Request, Response
+import respx
+
+from clients.firefly import FireflyClient
+from config import Config
+
+
+@respx.mock
+async def test_get_account_paginated(tmp_path: Path) -> None:
+    """Test the remaining pages are fetched in order with the same filters."""
+    config = Config(tmp_path / "config.json")
+    config.update(
+        {
+            "firefly_api_url": "https://firefly.example.com",
+            "firefly_access_token": "token",
+        }
+    )
+
+    def page(request: Request) -> Response:
+        number = int(request.url.params["page"])
+        return Response(
+            200,
+            json={
+                "data": [{"id": str(number)}],
+                "meta": {"pagination": {"current_page": number, "total_pages": 3}},
+            },
+        )
+
+    route = respx.get("https://firefly.example.com/api/v1/accounts").mock(
+        side_effect=page
+    )
+
+    async with FireflyClient(config=config) as client:
+        accounts = await client.get_account_paginated(account_type="asset", limit=1)
+
+    assert [account["id"] for account in accounts] == ["1", "2", "3"]
+    assert route.call_count == 3
+    for call in route.calls:
+        assert call.request.url.params["type"] == "asset"
+        assert call.request.url.params["limit"] == "1"
@@ -0,0 +1,51 @@
+"""Tests for the shared HTTPX client construction."""
+
+from pathlib import Path
+
+import pytest
+
+from clients.http_client import ConnectionStats, create_http_client, get_setting
+from config import Config
+
+
+def test_get_setting_precedence(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test settings come from the config first, then from the environment."""
+    config = Config(tmp_path / "config.json")
+    assert get_setting(config, "firefly_http_max_connections", 100, int) == 100
+
+    monkeypatch.setenv("FIREFLY_HTTP_MAX_CONNECTIONS", "25")
+    assert get_setting(config, "firefly_http_max_connections", 100, int) == 25
+
+    config.set("firefly_http_max_connections", 50)
+    assert get_setting(config, "firefly_http_max_connections", 100, int) == 50
+
+    config.set("firefly_http_max_connections", "many")
+    assert get_setting(config, "firefly_http_max_connections", 100, int) == 100
+
+
+async def test_create_http_client(tmp_path: Path) -> None:
+    """Test the client is created with the configured pool and timeouts."""
+    config = Config(tmp_path / "config.json")
+    config.update(
+        {"firefly_http_keepalive_expiry": 30, "firefly_http_read_timeout": 60}
+    )
+
+    client = create_http_client(config, "firefly", 10.0, ConnectionStats())
+    pool = client._transport._pool
+
+    assert pool._keepalive_expiry == 30
+    assert client.timeout.read == 60
+    assert client.timeout.connect == 10.0
+    await client.aclose()
+
+
+def test_connection_stats() -> None:
+    """Test the reused connections are derived from the request count."""
+    stats = ConnectionStats(requests=10, new_connections=2)
+    assert stats.as_dict() == {
+        "requests": 10,
+        "new_connections": 2,
+        "reused_connections": 8,
+    }
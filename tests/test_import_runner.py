@@ -0,0 +1,267 @@
+"""Tests for the import runner."""
+
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from config import Config
+from import_runner import ImportRunner
+from run_history import RunHistory
+
+
+class _ImporterStub:
+    """Importer stub which imports until it is released."""
+
+    def __init__(self, release: asyncio.Event, fail: bool = False) -> None:
+        self._release = release
+        self._fail = fail
+        self.transactions_processed = 0
+        self.transactions_failed = 0
+        self.account_stats: list[dict[str, Any]] = []
+
+    async def start_import(self, backfill_months: int | None = None) -> Any:
+        yield "Importing"
+        await self._release.wait()
+        self.transactions_processed = 10
+        if self._fail:
+            raise RuntimeError("Firefly is down")
+        yield "Imported"
+
+
+class _ConfigImporterStub(_ImporterStub):
+    """Importer stub reading a changed configuration and storing two settings."""
+
+    def __init__(self, config: Config) -> None:
+        super().__init__(asyncio.Event())
+        self._config = config
+
+    async def start_import(self, backfill_months: int | None = None) -> Any:
+        # Changed on disk by another process
+        self._config.path.write_text('{"other": 1}', encoding="utf-8")
+        assert self._config.get("other") == 1
+        self._config.set("first", 1)
+        self._config.set("second", 2)
+        yield "Imported"
+
+
+class _RunnerStub(ImportRunner):
+    """Runner creating importer stubs, counting the started imports."""
+
+    def __init__(self, config: Config, fail: bool = False) -> None:
+        super().__init__(config=config)
+        self.release = asyncio.Event()
+        self.started = 0
+        self._fail = fail
+
+    def _create_importer(self) -> Any:
+        self.started += 1
+        return _ImporterStub(self.release, self._fail)
+
+
+async def _overlapping_runs(runner: ImportRunner, runs: int) -> list[str]:
+    """Request imports while the first one runs, then get their outcomes."""
+    first = asyncio.create_task(runner.run_to_completion("first"))
+    await asyncio.sleep(0)
+    others = [
+        asyncio.create_task(runner.run_to_completion(f"run {index}"))
+        for index in range(runs)
+    ]
+    await asyncio.sleep(0)
+    runner.release.set()
+    return [run.outcome for run in await asyncio.gather(first, *others)]
+
+
+@pytest.mark.parametrize(
+    ("policy", "outcomes"),
+    [
+        ("skip", ["succeeded", "skipped", "skipped", "skipped"]),
+        ("queue", ["succeeded", "succeeded", "succeeded", "succeeded"]),
+        ("coalesce", ["succeeded", "succeeded", "skipped", "skipped"]),
+    ],
+)
+async def test_overlap_policy(tmp_path: Path, policy: str, outcomes: list[str]) -> None:
+    """Test the imports requested while another import runs."""
+    config = Config(tmp_path / "config.json")
+    config.set("import_overlap_policy", policy)
+    runner = _RunnerStub(config)
+
+    assert await _overlapping_runs(runner, 3) == outcomes
+    assert runner.started == outcomes.count("succeeded")
+    assert not runner.running
+
+
+async def test_run_is_timed(tmp_path: Path) -> None:
+    """Test the duration, throughput and outcome of a run are recorded."""
+    runner = _RunnerStub(Config(tmp_path / "config.json"))
+    runner.release.set()
+
+    run = await runner.run_to_completion("schedule")
+
+    assert run.outcome == "succeeded"
+    assert run.transactions == 10
+    assert run.duration > 0
+    assert run.as_dict()["trigger"] == "schedule"
+
+
+async def test_run_counts_config_disk_access(tmp_path: Path) -> None:
+    """Test the configuration reads and writes of a run are recorded."""
+    config = Config(tmp_path / "config.json", check_interval=0)
+    runner = _RunnerStub(config)
+    runner._create_importer = lambda: _ConfigImporterStub(config)
+
+    run = await runner.run_to_completion("schedule")
+
+    assert run.as_dict()["config"] == {"disk_reads": 1, "disk_writes": 1}
+
+
+async def test_failed_run_releases_lock(tmp_path: Path) -> None:
+    """Test a failed run is recorded and the next run can start."""
+    runner = _RunnerStub(Config(tmp_path / "config.json"), fail=True)
+    runner.release.set()
+
+    run = await runner.run_to_completion("manual")
+
+    assert run.outcome == "failed"
+    assert run.error == "Firefly is down"
+    assert not runner.running
+
+
+async def test_follow_is_single_flight(tmp_path: Path) -> None:
+    """Test followers share the running import and get the missed events."""
+    runner = _RunnerStub(Config(tmp_path / "config.json"))
+
+    async def follow() -> list[Any]:
+        return [event async for event in runner.follow("manual")]
+
+    first = asyncio.create_task(follow())
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(follow())
+    await asyncio.sleep(0.01)
+    assert runner.active.broadcast.subscribers == 2
+    runner.release.set()
+
+    assert await first == ["Importing", "Imported"]
+    assert await second == [
+        "An import is already running, following it",
+        "Importing",
+        "Imported",
+    ]
+    assert runner.started == 1
+    assert runner.active is None
+
+
+async def test_follow_joins_import_started_in_same_tick(tmp_path: Path) -> None:
+    """Test a follower joins a scheduled import requested just before it."""
+    runner = _RunnerStub(Config(tmp_path / "config.json"))
+    runner.release.set()
+
+    scheduled = asyncio.create_task(runner.run_to_completion("schedule"))
+    await asyncio.sleep(0)
+    events = [event async for event in runner.follow("manual", backfill_months=3)]
+
+    assert events == [
+        "An import is already running, following it without the requested "
+        "backfill of 3 month(s)",
+        "Importing",
+        "Imported",
+    ]
+    assert (await scheduled).outcome == "succeeded"
+    assert runner.started == 1
+    assert not runner.running
+
+
+async def test_cancelled_queued_job_releases_turn(tmp_path: Path) -> None:
+    """Test cancelled jobs, waiting or not started yet, don't block the runner."""
+    config = Config(tmp_path / "config.json")
+    config.set("import_overlap_policy", "queue")
+    runner = _RunnerStub(config)
+    first = runner.start("manual")
+    asyncio.create_task(runner.run_to_completion("schedule"))
+    await asyncio.sleep(0.01)
+    waiting = next(job for job in runner.jobs.values() if job is not first)
+    unstarted = runner._spawn(runner._create_job("schedule"), None)
+
+    for job in (waiting, unstarted, first):
+        job.task.cancel()
+    await asyncio.gather(
+        *(job.task for job in (waiting, unstarted, first)), return_exceptions=True
+    )
+
+    assert not runner.running
+    claimed = runner.start("manual")
+    claimed.task.cancel()
+    await asyncio.gather(claimed.task, return_exceptions=True)
+    assert not runner.running
+    runner.release.set()
+    assert (await runner.run_to_completion("schedule")).outcome == "succeeded"
+
+
+async def test_follow_raises_import_error(tmp_path: Path) -> None:
+    """Test every follower gets the error of a failed import."""
+    runner = _RunnerStub(Config(tmp_path / "config.json"), fail=True)
+
+    async def follow() -> None:
+        [event async for event in runner.follow("manual")]
+
+    followers = [asyncio.create_task(follow()) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    runner.release.set()
+
+    for follower in followers:
+        with pytest.raises(RuntimeError, match="Firefly is down"):
+            await follower
+    assert runner.started == 1
+    assert runner.last_run.outcome == "failed"
+
+
+async def test_job_replays_events(tmp_path: Path) -> None:
+    """Test the events of a finished job can still be streamed."""
+    runner = _RunnerStub(Config(tmp_path / "config.json"))
+    runner.release.set()
+    job = runner.start("manual")
+    assert runner.start("manual") is job
+
+    await job.task
+
+    assert runner.jobs[job.id].as_dict()["outcome"] == "succeeded"
+    assert [event async for event in job.broadcast.subscribe()] == [
+        "Importing",
+        "Imported",
+    ]
+
+
+@pytest.mark.parametrize(("timeout", "outcome"), [(1, "succeeded"), (0, "cancelled")])
+async def test_shutdown(tmp_path: Path, timeout: int, outcome: str) -> None:
+    """Test shutting down waits for the running job, up to the timeout."""
+    config = Config(tmp_path / "config.json")
+    config.set("import_shutdown_timeout", timeout)
+    runner = _RunnerStub(config)
+    job = runner.start("manual")
+    await asyncio.sleep(0)
+    asyncio.get_running_loop().call_later(0.01, runner.release.set)
+
+    await runner.shutdown()
+
+    assert job.run.outcome == outcome
+    assert not runner.running
+
+
+async def test_runs_are_stored(tmp_path: Path) -> None:
+    """Test finished runs are kept in the run history."""
+    config = Config(tmp_path / "config.json")
+    config.set("import_run_history_size", 2)
+    runner = _RunnerStub(config)
+    runner.release.set()
+
+    runs = [await runner.run_to_completion("schedule") for _ in range(3)]
+    runner.close()
+
+    history = RunHistory.from_config(config)
+    page, total = history.page(limit=1)
+    assert total == 2
+    assert page[0]["id"] == runs[-1].id
+    assert page[0]["transactions"] == 10
+    assert history.get(runs[0].id) is None
+    assert history.page(limit=10, offset=1)[0][0]["id"] == runs[1].id
@@ -0,0 +1,500 @@
+"""Tests for the import workflow."""
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from account_index import AccountIndex
+from config import Config
+from exceptions import (
+    TrueLayer2FireflyBadRequestError,
+    TrueLayer2FireflyDuplicateError,
+    TrueLayer2FireflyError,
+)
+from importer2firefly import (
+    BACKFILL_WINDOWS_KEY,
+    SYNC_CURSORS_KEY,
+    Import2Firefly,
+    _AccountRun,
+    month_windows,
+    parse_timestamp,
+)
+from ledger import ImportLedger
+
+
+def test_parse_timestamp_assumes_utc() -> None:
+    """Test timestamps without offset are interpreted as UTC."""
+    assert parse_timestamp("2024-03-01T10:00:00") == datetime(
+        2024, 3, 1, 10, tzinfo=UTC
+    )
+    assert parse_timestamp("2024-03-01T10:00:00+01:00") == datetime(
+        2024, 3, 1, 9, tzinfo=UTC
+    )
+
+
+def test_month_windows() -> None:
+    """Test the history is split into consecutive calendar months."""
+    now = datetime(2024, 2, 15, 12, tzinfo=UTC)
+    windows = month_windows(3, now)
+
+    assert [window[0] for window in windows] == [
+        datetime(2023, 12, 1, tzinfo=UTC),
+        datetime(2024, 1, 1, tzinfo=UTC),
+        datetime(2024, 2, 1, tzinfo=UTC),
+    ]
+    assert windows[0][1] == datetime(2024, 1, 1, tzinfo=UTC) - timedelta(seconds=1)
+    assert windows[-1][1] == now
+
+
+def _response(data: Any) -> Any:
+    """Create a successful response returning the data."""
+    return type(
+        "Response", (), {"status_code": 200, "json": lambda _self: data, "text": ""}
+    )()
+
+
+class _AccountsStub:
+    """Firefly client stub returning a fixed list of accounts."""
+
+    def __init__(self, accounts: list[dict[str, Any]]) -> None:
+        self.accounts = accounts
+
+    async def get_account_paginated(
+        self, account_type: str | None = None
+    ) -> list[dict[str, Any]]:
+        return [
+            account
+            for account in self.accounts
+            if account_type in (None, account["attributes"]["type"])
+        ]
+
+
+async def test_reconcile_accounts(tmp_path: Path) -> None:
+    """Test reconciling replaces the index and counts the full fetch."""
+    accounts = [
+        {"id": str(index), "attributes": {"type": "expense", "name": f"Shop {index}"}}
+        for index in range(3)
+    ]
+    importer = Import2Firefly(
+        truelayer_client=object(),
+        firefly_client=_AccountsStub(accounts),
+        config=Config(tmp_path / "config.json"),
+    )
+    importer.accounts_created = 2
+
+    index = await importer._reconcile_accounts(AccountIndex(accounts[:1]))
+
+    assert len(index) == 3
+    assert index.find_counterparty("expense", None, "Shop 2")[0] == accounts[2]
+    assert importer.account_refreshes_avoided == 1
+
+
+class _PostStub:
+    """Firefly client stub, the description tells how a transaction is handled."""
+
+    async def create_transaction(self, transaction_data: dict[str, Any]) -> Any:
+        await asyncio.sleep(0)
+        description = transaction_data["transactions"][0]["description"]
+        if description == "duplicate":
+            raise TrueLayer2FireflyDuplicateError("Duplicate of transaction")
+        if description == "fail":
+            raise TrueLayer2FireflyError("Firefly is down")
+        if description == "gone":
+            raise TrueLayer2FireflyBadRequestError("Account does not exist")
+        return _response({"data": {}})
+
+
+async def test_settle_posts(tmp_path: Path) -> None:
+    """Test concurrently posted transactions update the account run."""
+    config = Config(tmp_path / "config.json")
+    config.set("import_post_concurrency", 4)
+    importer = Import2Firefly(
+        truelayer_client=object(), firefly_client=_PostStub(), config=config
+    )
+
+    in_flight = {}
+    for day, description in enumerate(("created", "duplicate", "fail"), start=1):
+        transaction = {
+            "transactions": [
+                {
+                    "description": description,
+                    "amount": 1,
+                    "date": f"2024-01-0{day}",
+                    "account_id": "1",
+                    "linked_account_id": description,
+                }
+            ]
+        }
+        task = asyncio.create_task(importer._post_transaction(transaction))
+        in_flight[task] = datetime(2024, 1, day, tzinfo=UTC)
+
+    state = _AccountRun(total=3)
+    events = [
+        event async for event in importer._settle_posts(in_flight, state, "NL00", 0)
+    ]
+
+    assert not in_flight
+    assert [
+        event["data"]["current"] for event in events if isinstance(event, dict)
+    ] == [1, 2, 3]
+    assert state.failed == 1
+    assert state.latest_synced == datetime(2024, 1, 2, tzinfo=UTC)
+    assert state.earliest_failed == datetime(2024, 1, 3, tzinfo=UTC)
+
+    # Stored transactions are skipped on the next run, failed ones are not
+    assert "created" in importer._ledger
+    assert "duplicate" in importer._ledger
+    assert "fail" not in importer._ledger
+
+
+async def test_rejected_account_invalidates_cache(tmp_path: Path) -> None:
+    """Test the cached account types are fetched again after Firefly rejected them."""
+    importer = Import2Firefly(
+        truelayer_client=object(),
+        firefly_client=_PostStub(),
+        config=Config(tmp_path / "config.json"),
+    )
+    cache = importer._account_cache
+    for account_type in ("asset", "expense", "revenue"):
+        cache.replace(account_type, [])
+
+    outcome, _message = await importer._post_transaction(
+        {
+            "transactions": [
+                {
+                    "type": "withdrawal",
+                    "description": "gone",
+                    "amount": 1,
+                    "date": "2024-01-01",
+                    "account_id": "1",
+                    "linked_account_id": "gone",
+                }
+            ]
+        }
+    )
+
+    assert outcome == "failed"
+    assert cache.load("asset") is None
+    assert cache.load("expense") is None
+    assert cache.load("revenue") is not None
+
+
+class _AccountCreationStub:
+    """Firefly client stub counting the created accounts."""
+
+    def __init__(self) -> None:
+        self.created: list[dict[str, Any]] = []
+
+    async def create_account(self, account_data: dict[str, Any]) -> Any:
+        await asyncio.sleep(0)
+        self.created.append(account_data)
+        account = {"id": str(len(self.created)), "attributes": account_data}
+        return _response({"data": account})
+
+
+async def test_create_counterparty_is_single_flight(tmp_path: Path) -> None:
+    """Test concurrent creations of the same counterparty share one request."""
+    firefly = _AccountCreationStub()
+    importer = Import2Firefly(
+        truelayer_client=object(),
+        firefly_client=firefly,
+        config=Config(tmp_path / "config.json"),
+    )
+    shop = {"type": "expense", "name": "Shop", "iban": "NL00 BANK 0001"}
+
+    results = await asyncio.gather(
+        importer._create_counterparty(shop),
+        importer._create_counterparty({**shop, "iban": "nl00bank0001"}),
+        importer._create_counterparty({**shop, "type": "revenue"}),
+    )
+
+    assert len(firefly.created) == 2
+    assert results[0] == results[1]
+    assert results[0][0]["id"] != results[2][0]["id"]
+
+
+class _PipelineStub:
+    """TrueLayer and Firefly client stub keeping a timeline of the calls."""
+
+    def __init__(self) -> None:
+        self.timeline: list[str] = []
+        self.from_dates: dict[str, list[Any]] = {}
+        self.fetching = 0
+        self.max_fetching = 0
+
+    async def get_accounts(self) -> Any:
+        return _response(
+            {
+                "results": [
+                    {"account_id": iban, "account_number": {"iban": iban}}
+                    for iban in ("NL01", "NL02")
+                ]
+            }
+        )
+
+    async def get_transactions(
+        self, account_id: str, from_date: Any = None, to_date: Any = None
+    ) -> Any:
+        self.timeline.append(f"fetch {account_id}")
+        self.from_dates.setdefault(account_id, []).append(from_date)
+        self.fetching += 1
+        self.max_fetching = max(self.max_fetching, self.fetching)
+        await asyncio.sleep(0.01)
+        self.fetching -= 1
+        return _response(
+            {
+                "results": [
+                    {
+                        "transaction_id": f"{account_id}-{from_date}-{index}",
+                        "timestamp": f"2024-01-0{index + 1}T00:00:00+00:00",
+                        "description": "Coffee",
+                        "amount": -2.5,
+                        "transaction_type": "DEBIT",
+                    }
+                    for index in range(3)
+                ]
+            }
+        )
+
+    async def get_account_paginated(
+        self, account_type: str | None = None
+    ) -> list[dict[str, Any]]:
+        if account_type != "asset":
+            return []
+        return [
+            {
+                "id": iban,
+                "attributes": {
+                    "type": "asset",
+                    "name": iban,
+                    "iban": iban,
+                    "account_role": "defaultAsset",
+                },
+            }
+            for iban in ("NL01", "NL02")
+        ]
+
+    async def create_transaction(self, transaction_data: dict[str, Any]) -> Any:
+        await asyncio.sleep(0.01)
+        self.timeline.append(
+            f"post {transaction_data['transactions'][0]['account_id']}"
+        )
+        return _response({"data": {}})
+
+
+async def test_pipeline_fetches_while_posting(tmp_path: Path) -> None:
+    """Test the next account is fetched before the previous one is posted."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    stub = _PipelineStub()
+    importer = Import2Firefly(truelayer_client=stub, firefly_client=stub, config=config)
+
+    events = [event async for event in importer.start_import()]
+
+    assert stub.timeline.index("fetch NL02") < stub.timeline.index("post NL01")
+    assert stub.timeline.count("post NL01") == stub.timeline.count("post NL02") == 3
+    reports = [event for event in events if str(event).startswith("Report:")]
+    assert len(reports) == 2
+    stats = importer.pipeline_stats
+    assert stats["fetch"].items == 2
+    assert stats["match"].items == stats["map"].items == stats["post"].items == 4
+    assert events[-1]["type"] == "pipeline"
+
+
+async def test_pipeline_prefetches_accounts(tmp_path: Path) -> None:
+    """Test the accounts are fetched at the same time, within the limit."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    stub = _PipelineStub()
+    importer = Import2Firefly(truelayer_client=stub, firefly_client=stub, config=config)
+    [event async for event in importer.start_import()]
+
+    assert stub.max_fetching == 2
+    assert set(importer.fetch_latencies) == {"NL01", "NL02"}
+
+    config.set("import_fetch_concurrency", 1)
+    stub = _PipelineStub()
+    importer = Import2Firefly(truelayer_client=stub, firefly_client=stub, config=config)
+    [event async for event in importer.start_import()]
+
+    assert stub.max_fetching == 1
+
+
+async def test_pipeline_streams_backfill_windows(tmp_path: Path) -> None:
+    """Test backfill windows are posted before the whole history is fetched."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    config.set("import_backfill_concurrency", 1)
+    stub = _PipelineStub()
+    importer = Import2Firefly(truelayer_client=stub, firefly_client=stub, config=config)
+
+    events = [event async for event in importer.start_import(backfill_months=12)]
+
+    fetches = [
+        index for index, call in enumerate(stub.timeline) if call == "fetch NL01"
+    ]
+    assert len(fetches) == 12
+    assert stub.timeline.index("post NL01") < fetches[-1]
+    windows = [
+        event["data"]["window"]
+        for event in events
+        if isinstance(event, dict)
+        and event["type"] == "backfill"
+        and event["data"]["account"] == "NL01"
+    ]
+    assert windows == list(range(1, 13))
+
+
+class _FailingPipelineStub(_PipelineStub):
+    """Pipeline stub failing to fetch the second account."""
+
+    async def get_transactions(
+        self, account_id: str, from_date: Any = None, to_date: Any = None
+    ) -> Any:
+        if account_id == "NL02":
+            await asyncio.sleep(0.02)
+            raise RuntimeError("TrueLayer is down")
+        return await super().get_transactions(account_id, from_date, to_date)
+
+
+async def test_failed_import_closes_ledger(tmp_path: Path) -> None:
+    """Test the ledger is released when an import fails halfway."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    stub = _FailingPipelineStub()
+    importer = Import2Firefly(truelayer_client=stub, firefly_client=stub, config=config)
+
+    with pytest.raises(RuntimeError, match="TrueLayer is down"):
+        [event async for event in importer.start_import()]
+
+    assert importer._ledger._connection is None
+    ledger = ImportLedger.from_config(config)
+    ledger.connection.execute("PRAGMA busy_timeout = 0")
+    ledger.record("next", "NL01", None)
+    ledger.close()
+    assert "next" in ImportLedger.from_config(config)
+
+
+class _FailingFireflyStub(_PipelineStub):
+    """Pipeline stub failing to list the Firefly revenue accounts."""
+
+    async def get_account_paginated(
+        self, account_type: str | None = None
+    ) -> list[dict[str, Any]]:
+        if account_type == "revenue":
+            raise RuntimeError("Firefly is down")
+        return await super().get_account_paginated(account_type)
+
+
+async def test_failed_account_fetch_closes_stores(tmp_path: Path) -> None:
+    """Test the stores are released when the import fails before the pipeline."""
+    config = Config(tmp_path / "config.json")
+    stub = _FailingFireflyStub()
+    importer = Import2Firefly(truelayer_client=stub, firefly_client=stub, config=config)
+
+    with pytest.raises(RuntimeError, match="Firefly is down"):
+        [event async for event in importer.start_import()]
+
+    assert importer._account_cache._connection is None
+    assert importer._ledger._connection is None
+
+
+async def test_next_run_fetches_since_sync_cursor(tmp_path: Path) -> None:
+    """Test the next run only fetches from the stored cursor, minus the overlap."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    stub = _PipelineStub()
+
+    for _ in range(2):
+        importer = Import2Firefly(
+            truelayer_client=stub, firefly_client=stub, config=config
+        )
+        [event async for event in importer.start_import()]
+
+    assert config.get(SYNC_CURSORS_KEY) == {
+        "NL01": "2024-01-03T00:00:00+00:00",
+        "NL02": "2024-01-03T00:00:00+00:00",
+    }
+    assert stub.from_dates["NL01"] == [None, datetime(2023, 12, 31, tzinfo=UTC)]
+
+
+class _FailingPostStub(_PipelineStub):
+    """Pipeline stub failing to post the second transaction of NL01."""
+
+    async def create_transaction(self, transaction_data: dict[str, Any]) -> Any:
+        split = transaction_data["transactions"][0]
+        if split["account_id"] == "NL01" and split["date"].startswith("2024-01-02"):
+            raise TrueLayer2FireflyError("Firefly is down")
+        return await super().create_transaction(transaction_data)
+
+
+async def test_failed_post_holds_back_sync_cursor(tmp_path: Path) -> None:
+    """Test the cursor stays before a failed transaction, so it is fetched again."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    config.set("import_sync_overlap_hours", 0)
+    stub = _FailingPostStub()
+
+    for _ in range(2):
+        importer = Import2Firefly(
+            truelayer_client=stub, firefly_client=stub, config=config
+        )
+        [event async for event in importer.start_import()]
+
+    assert config.get(SYNC_CURSORS_KEY)["NL02"] == "2024-01-03T00:00:00+00:00"
+    assert stub.from_dates["NL01"] == [
+        None,
+        datetime(2024, 1, 1, 23, 59, 59, tzinfo=UTC),
+    ]
+
+
+async def test_backfill_resumes_from_completed_windows(tmp_path: Path) -> None:
+    """Test an interrupted backfill only fetches the windows left."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    config.set("import_backfill_concurrency", "2")
+    windows = month_windows(12, datetime.now(UTC))
+    config.set(
+        BACKFILL_WINDOWS_KEY,
+        {"NL01": [window_from.isoformat() for window_from, _ in windows[:10]]},
+    )
+    stub = _PipelineStub()
+    importer = Import2Firefly(truelayer_client=stub, firefly_client=stub, config=config)
+
+    [event async for event in importer.start_import(backfill_months=12)]
+
+    assert stub.from_dates["NL01"] == [windows[10][0], windows[11][0]]
+    assert len(stub.from_dates["NL02"]) == 12
+    assert config.get(BACKFILL_WINDOWS_KEY) == {}
+    assert set(config.get(SYNC_CURSORS_KEY)) == {"NL01", "NL02"}
+
+
+class _EmptyPipelineStub(_PipelineStub):
+    """Pipeline stub of accounts without transactions."""
+
+    async def get_transactions(
+        self, account_id: str, from_date: Any = None, to_date: Any = None
+    ) -> Any:
+        self.from_dates.setdefault(account_id, []).append(from_date)
+        return _response({"results": []})
+
+
+async def test_empty_backfill_stores_sync_cursor(tmp_path: Path) -> None:
+    """Test an account without transactions is not backfilled again."""
+    config = Config(tmp_path / "config.json")
+    config.set("firefly_account_cache", False)
+    config.set("import_backfill_months", 3)
+    config.set("import_sync_overlap_hours", 0)
+    stub = _EmptyPipelineStub()
+
+    for _ in range(2):
+        importer = Import2Firefly(
+            truelayer_client=stub, firefly_client=stub, config=config
+        )
+        [event async for event in importer.start_import()]
+
+    cursor = parse_timestamp(config.get(SYNC_CURSORS_KEY)["NL01"])
+    assert stub.from_dates["NL01"][3:] == [cursor]
@@ -0,0 +1,187 @@
+"""Tests for the local import ledger."""
+
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from ledger import (
+    ImportLedger,
+    index_journals,
+    rebuild_ledger,
+    transaction_fingerprint,
+)
+
+
+def test_fingerprint_matches_firefly_format() -> None:
+    """Test a TrueLayer and a Firefly transaction get the same fingerprint."""
+    assert transaction_fingerprint(
+        "2024-03-01T00:00:00+00:00", -12.3, "Coffee"
+    ) == transaction_fingerprint(
+        "2024-03-01T01:00:00+01:00", "12.300000000000", "Coffee"
+    )
+
+
+def test_index_journals_keeps_identical_transactions() -> None:
+    """Test identical transactions in Firefly are all kept."""
+    split = {"date": "2024-03-01T00:00:00+00:00", "amount": "2.5", "description": "Tea"}
+    groups = [
+        {"attributes": {"transactions": [{**split, "transaction_journal_id": 1}]}},
+        {"attributes": {"transactions": [{**split, "transaction_journal_id": 2}]}},
+    ]
+
+    assert index_journals(groups) == {
+        transaction_fingerprint("2024-03-01T00:00:00Z", -2.5, "Tea"): ["1", "2"]
+    }
+
+
+def test_recorded_transactions_survive(tmp_path: Path) -> None:
+    """Test flushed transactions are known to a new ledger instance."""
+    ledger = ImportLedger(tmp_path / "ledger.sqlite", source="https://firefly")
+    ledger.record("tx-1", "1", "101")
+    ledger.record("tx-2", "1", None)
+    ledger.flush()
+    ledger.close()
+
+    ledger = ImportLedger(tmp_path / "ledger.sqlite", source="https://firefly")
+    assert "tx-1" in ledger
+    assert "tx-3" not in ledger
+    assert len(ledger) == 2
+    assert ledger.journal_id("tx-1") == "101"
+
+    other = ImportLedger(tmp_path / "ledger.sqlite", source="https://other")
+    assert len(other) == 0
+
+
+class _Response:
+    """Response stub of the TrueLayer client."""
+
+    status_code = 200
+
+    def __init__(self, data: dict[str, Any]) -> None:
+        self._data = data
+
+    def json(self) -> dict[str, Any]:
+        return self._data
+
+
+class _TrueLayerStub:
+    """TrueLayer client stub with a single account."""
+
+    async def get_accounts(self) -> _Response:
+        return _Response(
+            {"results": [{"account_id": "tl-1", "account_number": {"iban": "NL00"}}]}
+        )
+
+    async def get_transactions(self, account_id: str, from_date: Any) -> _Response:
+        return _Response(
+            {
+                "results": [
+                    {
+                        "transaction_id": f"tx-{index}",
+                        "timestamp": f"2024-03-0{index}T00:00:00+00:00",
+                        "amount": -index,
+                        "description": "Coffee",
+                    }
+                    for index in (1, 2)
+                ]
+            }
+        )
+
+
+class _FireflyStub:
+    """Firefly client stub which only stored the first transaction."""
+
+    async def get_account_paginated(self, account_type: str) -> list[dict[str, Any]]:
+        return [
+            {
+                "id": "1",
+                "attributes": {
+                    "type": "asset",
+                    "iban": "NL00",
+                    "account_role": "defaultAsset",
+                },
+            }
+        ]
+
+    async def get_account_transactions(
+        self, account_id: str, start: Any, end: Any
+    ) -> list[dict[str, Any]]:
+        return [
+            {
+                "id": "50",
+                "attributes": {
+                    "transactions": [
+                        {
+                            "transaction_journal_id": 101,
+                            "date": "2024-03-01T01:00:00+01:00",
+                            "amount": "1.000000000000",
+                            "description": "Coffee",
+                        }
+                    ]
+                },
+            }
+        ]
+
+
+async def test_rebuild_ledger(tmp_path: Path) -> None:
+    """Test the ledger is rebuilt from the transactions found in Firefly."""
+    ledger = ImportLedger(tmp_path / "ledger.sqlite")
+    ledger.record("stale", "1", None)
+
+    messages = [
+        message
+        async for message in rebuild_ledger(ledger, _TrueLayerStub(), _FireflyStub())
+    ]
+
+    assert "Ledger: 1 of 2 transaction(s) of NL00 found in Firefly" in messages
+    assert "tx-1" in ledger
+    assert "tx-2" not in ledger
+    assert "stale" not in ledger
+    assert ledger.journal_id("tx-1") == "101"
+
+
+async def test_rebuild_ledger_since(tmp_path: Path) -> None:
+    """Test a partial rebuild keeps the older transactions."""
+    ledger = ImportLedger(tmp_path / "ledger.sqlite")
+    ledger.record("older", "1", None)
+    ledger.record("tx-2", "1", None)
+    since = datetime(2024, 3, 1, tzinfo=UTC)
+
+    [
+        message
+        async for message in rebuild_ledger(
+            ledger, _TrueLayerStub(), _FireflyStub(), since
+        )
+    ]
+
+    assert "older" in ledger
+    assert "tx-1" in ledger
+    assert "tx-2" not in ledger
+
+
+class _FailingFireflyStub(_FireflyStub):
+    """Firefly client stub which fails to list the transactions."""
+
+    async def get_account_transactions(
+        self, account_id: str, start: Any, end: Any
+    ) -> list[dict[str, Any]]:
+        raise RuntimeError("Firefly is down")
+
+
+async def test_failed_rebuild_keeps_ledger(tmp_path: Path) -> None:
+    """Test the ledger is unchanged when a rebuild fails."""
+    ledger = ImportLedger(tmp_path / "ledger.sqlite")
+    ledger.record("stale", "1", None)
+    ledger.flush()
+
+    with pytest.raises(RuntimeError):
+        [
+            message
+            async for message in rebuild_ledger(
+                ledger, _TrueLayerStub(), _FailingFireflyStub()
+            )
+        ]
+
+    assert "stale" in ledger
@@ -0,0 +1,63 @@
+"""Tests for the progress emitter of the import stream."""
+
+from collections.abc import AsyncGenerator
+import json
+from typing import Any
+
+import pytest
+
+from progress import ProgressEmitter
+
+
+def _parse(frame: str) -> tuple[str | None, Any]:
+    """Get the event name and data of an SSE frame."""
+    event = None
+    for line in frame.strip().splitlines():
+        if line.startswith("event: "):
+            event = line.removeprefix("event: ")
+        elif line.startswith("data: "):
+            data = json.loads(line.removeprefix("data: "))
+    return event, data
+
+
+async def _import(total: int) -> AsyncGenerator[Any, None]:
+    """Simulate an import which reports every transaction."""
+    yield {"type": "backfill", "data": {"account": "NL00", "window": 1}}
+    for current in range(1, total + 1):
+        yield f"Transaction created: {current}"
+        yield {
+            "type": "progress",
+            "data": {"account": "NL00", "current": current, "total": total},
+        }
+
+
+async def test_events_are_coalesced() -> None:
+    """Test a burst of events results in a few frames, losing no log lines."""
+    emitter = ProgressEmitter(_import(500), max_frame_rate=10)
+    frames = [_parse(frame) async for frame in emitter.frames()]
+
+    assert frames[0] == ("backfill", {"account": "NL00", "window": 1})
+    assert len(frames) < 10
+    assert emitter.events_received == 1001
+
+    lines = [line for event, data in frames if event == "log" for line in data]
+    assert lines == [f"Transaction created: {current}" for current in range(1, 501)]
+
+    progress = [data for event, data in frames if event == "progress"]
+    assert progress[-1]["current"] == 500
+    assert progress[-1]["eta"] in (0, None)
+
+
+async def test_import_error_is_raised_after_its_events() -> None:
+    """Test the events before an error are sent before it is raised."""
+
+    async def failing_import() -> AsyncGenerator[Any, None]:
+        yield "Fetching accounts"
+        raise RuntimeError("Firefly is down")
+
+    frames = []
+    with pytest.raises(RuntimeError):
+        async for frame in ProgressEmitter(failing_import()).frames():
+            frames.append(_parse(frame))
+
+    assert frames == [("log", ["Fetching accounts"])]
@@ -0,0 +1,94 @@
+"""Tests for the retry policy and rate limiting."""
+
+import time
+
+import httpx
+import pytest
+import respx
+
+from clients.retry import (
+    RetryPolicy,
+    TokenBucket,
+    parse_retry_after,
+    send_with_retry,
+)
+
+URL = "https://api.firefly.com/api/v1/transactions"
+
+
+def test_parse_retry_after() -> None:
+    """Test Retry-After is parsed as seconds or as an HTTP date."""
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+@respx.mock
+async def test_retry_idempotent_request() -> None:
+    """Test a GET is retried after a server error."""
+    route = respx.get(URL).mock(
+        side_effect=[httpx.Response(503), httpx.Response(200, json={})]
+    )
+    async with httpx.AsyncClient() as client:
+        response = await send_with_retry(
+            client, "GET", URL, policy=RetryPolicy(base_delay=0)
+        )
+
+    assert response.status_code == 200
+    assert route.call_count == 2
+
+
+@respx.mock
+async def test_no_retry_for_unsafe_post() -> None:
+    """Test a POST which is not idempotent is not retried after a server error."""
+    route = respx.post(URL).mock(return_value=httpx.Response(503))
+    async with httpx.AsyncClient() as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await send_with_retry(client, "POST", URL, policy=RetryPolicy(base_delay=0))
+
+    assert route.call_count == 1
+
+
+@respx.mock
+async def test_retry_after_honored_for_post() -> None:
+    """Test a rate limited POST is retried after the Retry-After delay."""
+    route = respx.post(URL).mock(
+        side_effect=[
+            httpx.Response(429, headers={"Retry-After": "0.2"}),
+            httpx.Response(200, json={}),
+        ]
+    )
+    limiter = TokenBucket(rate=0, capacity=1)
+    start = time.monotonic()
+    async with httpx.AsyncClient() as client:
+        await send_with_retry(
+            client, "POST", URL, policy=RetryPolicy(base_delay=0), limiter=limiter
+        )
+
+    assert route.call_count == 2
+    assert time.monotonic() - start >= 0.2
+
+
+@respx.mock
+async def test_give_up_after_attempts() -> None:
+    """Test the last error is raised once all attempts are used."""
+    route = respx.get(URL).mock(return_value=httpx.Response(500))
+    async with httpx.AsyncClient() as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await send_with_retry(
+                client, "GET", URL, policy=RetryPolicy(attempts=3, base_delay=0)
+            )
+
+    assert route.call_count == 3
+
+
+async def test_token_bucket_limits_rate() -> None:
+    """Test the token bucket spreads a burst over time."""
+    limiter = TokenBucket(rate=50, capacity=5)
+    start = time.monotonic()
+    for _ in range(10):
+        await limiter.acquire()
+
+    # The first 5 requests use the burst, the other 5 wait 20 ms each
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,41 @@
+"""Tests for the run history."""
+
+from pathlib import Path
+
+from run_history import RunHistory, percentiles
+
+
+def test_percentiles() -> None:
+    """Test the latency percentiles use the nearest rank, in milliseconds."""
+    samples = [index / 1000 for index in range(100, 0, -1)]
+
+    assert percentiles(samples) == {
+        "p50_ms": 50.0,
+        "p90_ms": 90.0,
+        "p99_ms": 99.0,
+        "max_ms": 100.0,
+    }
+    assert percentiles([])["p50_ms"] is None
+
+
+def test_history_persists(tmp_path: Path) -> None:
+    """Test runs survive reopening the history, newest first."""
+    history = RunHistory(tmp_path / "runs.sqlite")
+    for index in range(3):
+        history.record(
+            {
+                "id": str(index),
+                "trigger": "manual",
+                "started_at": f"2024-01-0{index + 1}T00:00:00+00:00",
+                "finished_at": None,
+                "outcome": "succeeded",
+                "accounts": [{"account": "NL01", "fetched": index}],
+            }
+        )
+    history.close()
+
+    history = RunHistory(tmp_path / "runs.sqlite")
+    page, total = history.page(limit=2)
+    assert total == 3
+    assert [run["id"] for run in page] == ["2", "1"]
+    assert history.get("0")["accounts"] == [{"account": "NL01", "fetched": 0}]
@@ -0,0 +1,29 @@
+"""Tests for the scheduler."""
+
+from pathlib import Path
+
+from config import Config
+from scheduler import Scheduler, runs_per_day
+
+
+def test_runs_per_day() -> None:
+    """Test the number of runs of a cron schedule in a day."""
+    assert runs_per_day("*/5 * * * *") == 288
+    assert runs_per_day("0 * * * *") == 24
+    assert runs_per_day("0 0 * * *") == 1
+
+
+def test_schedule_within_call_budget(tmp_path: Path) -> None:
+    """Test a schedule within the call budget is kept."""
+    scheduler = Scheduler(config=Config(tmp_path / "config.json"))
+    assert scheduler._apply_call_budget("0 */6 * * *") == "0 */6 * * *"
+
+
+def test_schedule_exceeding_call_budget(tmp_path: Path) -> None:
+    """Test a schedule exceeding the call budget is only clamped on request."""
+    config = Config(tmp_path / "config.json")
+    scheduler = Scheduler(config=config)
+    assert scheduler._apply_call_budget("0 * * * *") == "0 * * * *"
+
+    config.set("scheduler_clamp_to_call_budget", True)
+    assert scheduler._apply_call_budget("0 * * * *") == "0 */6 * * *"
@@ -1,14 +1,20 @@
 """Basic tests for Truelayer2Firefly."""
 
+import asyncio
+from datetime import UTC, datetime
+from pathlib import Path
+import time
 from unittest.mock import patch
 
 import httpx
+import jwt
 import pytest
 from aiohttp import ClientError, ClientSession
 from aresponses import ResponsesMockServer
 import respx
 
 from clients.truelayer import TrueLayerClient
+from config import Config
 from exceptions import (
     TrueLayer2FireflyAuthorizationError,
     TrueLayer2FireflyConnectionError,
@@ -121,3 +127,79 @@ async def test_response_status(
     )
     with pytest.raises(expected_exception):
         await truelayer_client._request("test")
+
+
+@respx.mock
+async def test_get_transactions_date_range(tmp_path: Path) -> None:
+    """Test the transactions are requested for the given date range."""
+    route = respx.get(
+        "https://api.truelayer.com/data/v1/accounts/account_id/transactions"
+    ).mock(return_value=httpx.Response(200, json={"results": []}))
+
+    async with TrueLayerClient(
+        client_id="test_client_id",
+        client_secret="test_client_secret",
+        redirect_uri="http://localhost/truelayer/callback",
+        config=Config(tmp_path / "config.json"),
+    ) as client:
+        await client.get_transactions(
+            "account_id",
+            from_date=datetime(2024, 1, 1, tzinfo=UTC),
+            to_date=datetime(2024, 2, 1, tzinfo=UTC),
+        )
+
+    assert route.called
+    params = route.calls.last.request.url.params
+    assert params["from"] == "2024-01-01T00:00:00+00:00"
+    assert params["to"] == "2024-02-01T00:00:00+00:00"
+
+
+@respx.mock
+async def test_retries_count_against_call_budget(tmp_path: Path) -> None:
+    """Test every attempt sent to TrueLayer is counted, retries included."""
+    respx.get("https://api.truelayer.com/data/v1/accounts").mock(
+        side_effect=[
+            httpx.Response(503),
+            httpx.Response(200, json={"results": []}),
+        ]
+    )
+    config = Config(tmp_path / "config.json")
+    config.set("truelayer_retry_base_delay", 0)
+
+    async with TrueLayerClient(config=config) as client:
+        await client._request("accounts")
+
+    assert client.call_budget.used("accounts") == 2
+    assert config.get("truelayer_call_budget")["calls"]["default"] == {"accounts": 2}
+
+
+@respx.mock
+async def test_concurrent_refresh_is_single_flight(tmp_path: Path) -> None:
+    """Test concurrent requests with an expired token share one refresh."""
+    config = Config(tmp_path / "config.json")
+    config.update(
+        {
+            "truelayer_access_token": "expired_access_token",
+            "truelayer_refresh_token": "test_refresh_token",
+            "truelayer_expiration_date": time.time() - 10,
+        }
+    )
+    new_token = jwt.encode(
+        {"sub": "credentials_id", "exp": int(time.time()) + 3600}, "s" * 32
+    )
+    token_route = respx.post("https://auth.truelayer.com/connect/token").mock(
+        return_value=httpx.Response(
+            200,
+            json={"access_token": new_token, "refresh_token": "new_refresh_token"},
+        )
+    )
+    respx.get("https://api.truelayer.com/data/v1/accounts").mock(
+        return_value=httpx.Response(200, json={"results": []})
+    )
+
+    async with TrueLayerClient(config=config) as client:
+        await asyncio.gather(*(client.get_accounts() for _ in range(5)))
+
+    assert token_route.call_count == 1
+    assert config.get("truelayer_refresh_token") == "new_refresh_token"
+    assert config.get("truelayer_credentials_id") == "credentials_id"
@@ -1,10 +1,10 @@
 import base64
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, AsyncIterator
 from hashlib import sha256
-import json
 import secrets
 import string
-from fastapi import FastAPI, Form, Request, Depends
+from typing import Any
+from fastapi import FastAPI, Form, Query, Request, Depends
 from fastapi.responses import (
     HTMLResponse,
     JSONResponse,
@@ -24,7 +24,7 @@ from apscheduler.triggers.cron import CronTrigger
 from clients.firefly import FireflyClient
 from clients.truelayer import TrueLayerClient
 from scheduler import Scheduler
-from config import Config
+from config import get_config
 from exception_handlers import (
     truelayer_authorization_error_handler,
     truelayer_connection_error_handler,
@@ -38,7 +38,8 @@ from exceptions import (
     TrueLayer2FireflyError,
     TrueLayer2FireflyTimeoutError,
 )
-from importer2firefly import Import2Firefly
+from import_runner import ImportJob, ImportRunner
+from progress import DEFAULT_MAX_FRAME_RATE, ProgressEmitter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -48,7 +49,7 @@ _LOGGER = logging.getLogger(__name__)
 
 logging.getLogger("uvicorn").setLevel(logging.INFO)
 
-config = Config()
+config = get_config()
 
 
 @asynccontextmanager
@@ -58,16 +59,27 @@ async def lifespan(application: FastAPI) -> AsyncGenerator[None, None]:
         client_id=config.get("truelayer_client_id"),
         client_secret=config.get("truelayer_client_secret"),
         redirect_uri=config.get("truelayer_redirect_uri"),
+        config=config,
     )
+    application.state.truelayer_client.start_token_refresher()
     _LOGGER.info("TrueLayer client initialized")
 
     application.state.firefly_client = FireflyClient(
         url=config.get("firefly_api_url"),
         access_token=config.get("firefly_access_token"),
+        config=config,
     )
     _LOGGER.info("Firefly client initialized")
 
-    application.state.scheduler = Scheduler()
+    application.state.import_runner = ImportRunner(
+        truelayer_client=application.state.truelayer_client,
+        firefly_client=application.state.firefly_client,
+        config=config,
+    )
+
+    application.state.scheduler = Scheduler(
+        config=config, runner=application.state.import_runner
+    )
     _LOGGER.info("Scheduler initialized")
 
     application.state.scheduler.start()
@@ -75,6 +87,16 @@ async def lifespan(application: FastAPI) -> AsyncGenerator[None, None]:
 
     yield
 
+    # Stop the scheduler and the imports first, they share the clients closed below
+    if scheduler := application.state.scheduler:
+        scheduler.stop()
+        _LOGGER.info("Scheduler stopped")
+
+    if runner := application.state.import_runner:
+        await runner.shutdown()
+        runner.close()
+        _LOGGER.info("Import runner stopped")
+
     if client := application.state.truelayer_client:
         await client.close()
         _LOGGER.info("TrueLayer client closed")
@@ -83,9 +105,7 @@ async def lifespan(application: FastAPI) -> AsyncGenerator[None, None]:
         await client.close()
         _LOGGER.info("Firefly client closed")
 
-    if scheduler := application.state.scheduler:
-        scheduler.stop()
-        _LOGGER.info("Scheduler stopped")
+    config.flush()
 
     _LOGGER.info("Application shutdown complete")
 
@@ -111,6 +131,14 @@ async def get_firefly_client() -> FireflyClient:
     return client
 
 
+async def get_import_runner() -> ImportRunner:
+    """Get the import runner from the application state."""
+    runner = app.state.import_runner
+    if not runner:
+        raise RuntimeError("Import runner is not initialized.")
+    return runner
+
+
 async def get_scheduler() -> Scheduler:
     """Get the scheduler from the application state."""
     scheduler = app.state.scheduler
@@ -137,8 +165,9 @@ async def firefly_configuration(
 ):
     """Handle the configuration form submission."""
     _LOGGER.info("Starting configuration...")
-    config.set("firefly_api_url", firefly_url)
-    config.set("firefly_client_id", firefly_client_id)
+    with config.transaction():
+        config.set("firefly_api_url", firefly_url)
+        config.set("firefly_client_id", firefly_client_id)
 
     state = "".join(
         secrets.choice(string.ascii_letters + string.digits) for _ in range(40)
@@ -188,7 +217,7 @@ async def firefly_configuration(
 
 @app.get("/firefly/callback", name="firefly/callback")
 async def firefly_callback(
-    request: Request, firefly: FireflyClient = Depends(FireflyClient)
+    request: Request, firefly: FireflyClient = Depends(get_firefly_client)
 ):
     """Handle the callback from Firefly."""
     code = request.query_params.get("code")
@@ -222,9 +251,11 @@ async def firefly_callback(
     response = response.json()
 
     _LOGGER.info("Received access token response: %s", response)
-    config.set("firefly_access_token", response["access_token"])
-    config.set("firefly_refresh_token", response["refresh_token"])
-    config.set("firefly_expires_in", response["expires_in"])
+    with config.transaction():
+        config.set("firefly_access_token", response["access_token"])
+        config.set("firefly_refresh_token", response["refresh_token"])
+        config.set("firefly_expires_in", response["expires_in"])
+    firefly.access_token = response["access_token"]
 
     return RedirectResponse(
         str(request.url_for("index")),
@@ -233,7 +264,7 @@ async def firefly_callback(
 
 
 @app.get("/firefly/healthcheck")
-async def firefly_healthcheck(firefly: FireflyClient = Depends(FireflyClient)):
+async def firefly_healthcheck(firefly: FireflyClient = Depends(get_firefly_client)):
     """Check the health of the Firefly API."""
 
     if not firefly.access_token:
@@ -268,9 +299,10 @@ async def truelayer_configuration(
 ):
     """Handle the TrueLayer configuration form submission."""
     _LOGGER.info("Starting TrueLayer configuration...")
-    config.set("truelayer_client_id", truelayer_client_id)
-    config.set("truelayer_client_secret", truelayer_client_secret)
-    config.set("truelayer_redirect_uri", truelayer_redirect_uri)
+    with config.transaction():
+        config.set("truelayer_client_id", truelayer_client_id)
+        config.set("truelayer_client_secret", truelayer_client_secret)
+        config.set("truelayer_redirect_uri", truelayer_redirect_uri)
 
     auth_url = await truelayer.get_authorization_url()
     _LOGGER.info("Authorization URL: %s", auth_url)
@@ -299,8 +331,9 @@ async def callback(request: Request) -> None:
     scope = request.query_params.get("scope")
 
     _LOGGER.info("Received code: %s and scope: %s", code, scope)
-    config.set("truelayer_code", code)
-    config.set("truelayer_scope", scope)
+    with config.transaction():
+        config.set("truelayer_code", code)
+        config.set("truelayer_scope", scope)
 
     return RedirectResponse(
         str(request.url_for("truelayer/get-access-token")),
@@ -320,7 +353,7 @@ async def truelayer_healthcheck(
             content={"error": "TrueLayer API access token is not set"},
         )
 
-    response = await truelayer.get_accounts()
+    response = await truelayer.get_accounts(essential=False)
     if response.status_code != 200:
         _LOGGER.error(
             "TrueLayer API health check failed with status code %s",
@@ -337,28 +370,140 @@ async def truelayer_healthcheck(
     return {"status": "OK"}
 
 
-@app.get("/import/stream")
-async def import_stream() -> StreamingResponse:
-    """Stream the import process."""
-    _LOGGER.info("Starting import process")
-
-    importer = Import2Firefly()
+@app.get("/truelayer/call-budget")
+async def truelayer_call_budget(
+    truelayer: TrueLayerClient = Depends(get_truelayer_client),
+) -> dict[str, Any]:
+    """Get the TrueLayer calls made today against the daily budget."""
+    return truelayer.call_budget.as_dict()
+
+
+def import_event_stream(events: AsyncIterator[Any]) -> StreamingResponse:
+    """Stream the events of an import as Server-Sent Events."""
+    emitter = ProgressEmitter(
+        events,
+        max_frame_rate=config.get(
+            "import_stream_max_frame_rate", DEFAULT_MAX_FRAME_RATE
+        ),
+    )
 
     async def event_generator() -> AsyncGenerator[str, None]:
         """Generate events for the import process."""
         try:
-            async for event in importer.start_import():
-                if isinstance(event, dict) and event.get("type") == "progress":
-                    yield f"event: progress\ndata: {json.dumps(event['data'])}\n\n"
-                else:
-                    yield f"data: {json.dumps(event)}\n\n"
+            async for frame in emitter.frames():
+                yield frame
         except Exception as e:
             _LOGGER.error(f"Error during import: {e}")
             yield f"data: Error: {e}\n\n"
+        _LOGGER.debug(
+            "Import stream sent %s frame(s) for %s event(s)",
+            emitter.frames_sent,
+            emitter.events_received,
+        )
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
+@app.get("/import/stream")
+async def import_stream(
+    backfill_months: int | None = None,
+    runner: ImportRunner = Depends(get_import_runner),
+) -> StreamingResponse:
+    """Stream the import process.
+
+    Pass `backfill_months` to import the history of the accounts in monthly chunks.
+    When an import is running already, its events are streamed instead, starting
+    with the recent events it sent before.
+    """
+    _LOGGER.info("Starting import process")
+    return import_event_stream(runner.follow("manual", backfill_months=backfill_months))
+
+
+@app.get("/import/status")
+async def import_status(
+    runner: ImportRunner = Depends(get_import_runner),
+) -> dict[str, Any]:
+    """Get the running import and the outcome of the last import."""
+    return {
+        "running": runner.running,
+        "current": runner.active.as_dict() if runner.active else None,
+        "last_run": runner.last_run.as_dict() if runner.last_run else None,
+    }
+
+
+@app.post("/import", status_code=202)
+async def start_import_job(
+    backfill_months: int | None = None,
+    runner: ImportRunner = Depends(get_import_runner),
+) -> dict[str, Any]:
+    """Start an import in the background and get its job.
+
+    When an import is running already, the job of that import is returned.
+    """
+    job = runner.start("manual", backfill_months=backfill_months)
+    _LOGGER.info("Import job %s started", job.id)
+    return job.as_dict()
+
+
+async def get_import_job(
+    job_id: str, runner: ImportRunner = Depends(get_import_runner)
+) -> ImportJob:
+    """Get an import job of the runner."""
+    if (job := runner.jobs.get(job_id)) is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@app.get("/import/{job_id}")
+async def import_job(job: ImportJob = Depends(get_import_job)) -> dict[str, Any]:
+    """Get the status and statistics of an import job."""
+    return job.as_dict()
+
+
+@app.get("/import/{job_id}/events")
+async def import_job_events(
+    job: ImportJob = Depends(get_import_job),
+) -> StreamingResponse:
+    """Stream the events of an import job, starting with its recent events."""
+    return import_event_stream(job.broadcast.subscribe())
+
+
+@app.get("/runs")
+async def import_runs(
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    runner: ImportRunner = Depends(get_import_runner),
+) -> dict[str, Any]:
+    """Get a page of the stored import runs, newest first."""
+    if runner.history is None:
+        raise HTTPException(status_code=404, detail="Run history is disabled")
+    page, total = runner.history.page(limit, offset)
+    return {"total": total, "limit": limit, "offset": offset, "runs": page}
+
+
+@app.get("/runs/{run_id}")
+async def import_run(
+    run_id: str, runner: ImportRunner = Depends(get_import_runner)
+) -> dict[str, Any]:
+    """Get a stored import run."""
+    if runner.history is None or (stored := runner.history.get(run_id)) is None:
+        raise HTTPException(status_code=404, detail="Import run not found")
+    return stored
+
+
+@app.get("/http/stats")
+async def http_stats(
+    truelayer: TrueLayerClient = Depends(get_truelayer_client),
+    firefly: FireflyClient = Depends(get_firefly_client),
+) -> dict[str, dict[str, int]]:
+    """Get the connection reuse statistics of the API clients."""
+    return {
+        "truelayer": truelayer.connection_stats.as_dict(),
+        "firefly": firefly.connection_stats.as_dict(),
+        "config": {"disk_reads": config.disk_reads, "disk_writes": config.disk_writes},
+    }
+
+
 @app.get("/reset-configuration")
 async def reset_configuration(request: Request):
     """Reset the configuration."""